@@ -0,0 +1,20 @@
+# src/submit/modules/embeddings/_topk.py
+"""
+Выбор топ-k по матрице score - общий для VectorStore и ImprovedVectorStore
+"""
+import numpy as np
+
+
+def top_k_desc(scores: np.ndarray, k: int):
+    """
+    Топ-k по каждой строке матрицы score (Q x N) сразу для всех запросов.
+    Возвращает индексы и значения (Q x k), отсортированные по убыванию
+    """
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty.astype(np.intp), empty
+    top = np.argpartition(scores, -k, axis=1)[:, -k:]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    # Сортируем k элементов по -score: сразу по убыванию, без развёрнутого вида
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
@@ -72,24 +72,28 @@ class EmbeddingEngine:
         self.cache_hits = 0
         self.cache_misses = 0
     
-    def encode_single(self, text: str, normalize: bool = True) -> np.ndarray:
+    def encode_single(self, text: str, normalize: bool = True,
+                      use_cache: bool = True) -> np.ndarray:
         """
         Кодирует один текст в вектор
         
         Args:
             text: Текст для кодирования
             normalize: Нормализовать ли вектор
+            use_cache: Искать и сохранять вектор в кэше (для уникальных
+                поисковых запросов кэш - лишний хэш и рост памяти)
             
         Returns:
             Вектор эмбеддинга
         """
         # Проверяем кэш
-        cache_key = self._get_cache_key(text, normalize)
-        if cache_key in self.cache:
-            self.cache_hits += 1
-            return self.cache[cache_key]
-        
-        self.cache_misses += 1
+        if use_cache:
+            cache_key = self._get_cache_key(text, normalize)
+            if cache_key in self.cache:
+                self.cache_hits += 1
+                return self.cache[cache_key]
+            
+            self.cache_misses += 1
         
         # Токенизация
         inputs = self.tokenizer(
@@ -125,12 +129,14 @@ class EmbeddingEngine:
             embedding = mean_embeddings.cpu().numpy()[0]
         
         # Сохраняем в кэш
-        self.cache[cache_key] = embedding
+        if use_cache:
+            self.cache[cache_key] = embedding
         
         return embedding
     
     def encode_batch(self, texts: List[str], normalize: bool = True,
-                    batch_size: int = 32, show_progress: bool = False) -> np.ndarray:
+                    batch_size: int = 32, show_progress: bool = False,
+                    use_cache: bool = True) -> np.ndarray:
         """
         Кодирует батч текстов
         
@@ -139,6 +145,7 @@ class EmbeddingEngine:
             normalize: Нормализовать ли векторы
             batch_size: Размер батча
             show_progress: Показывать прогресс
+            use_cache: Искать и сохранять векторы в кэше
             
         Returns:
             Матрица эмбеддингов
@@ -159,16 +166,23 @@ class EmbeddingEngine:
             batch_embeddings = []
             uncached_texts = []
             uncached_indices = []
+            uncached_keys = []
             
-            for j, text in enumerate(batch_texts):
-                cache_key = self._get_cache_key(text, normalize)
-                if cache_key in self.cache:
-                    batch_embeddings.append((j, self.cache[cache_key]))
-                    self.cache_hits += 1
-                else:
-                    uncached_texts.append(text)
-                    uncached_indices.append(j)
-                    self.cache_misses += 1
+            if use_cache:
+                for j, text in enumerate(batch_texts):
+                    cache_key = self._get_cache_key(text, normalize)
+                    if cache_key in self.cache:
+                        batch_embeddings.append((j, self.cache[cache_key]))
+                    else:
+                        uncached_texts.append(text)
+                        uncached_indices.append(j)
+                        uncached_keys.append(cache_key)
+                self.cache_hits += len(batch_embeddings)
+                self.cache_misses += len(uncached_texts)
+            else:
+                # Без кэша не считаем ни хэши, ни статистику попаданий
+                uncached_texts = batch_texts
+                uncached_indices = list(range(len(batch_texts)))
             
             # Кодируем некэшированные тексты
             if uncached_texts:
@@ -208,11 +222,10 @@ class EmbeddingEngine:
                     # Конвертируем в numpy
                     new_embeddings = mean_embeddings.cpu().numpy()
                 
-                # Добавляем в кэш и результаты
-                for idx, text, embedding in zip(uncached_indices, uncached_texts, new_embeddings):
-                    cache_key = self._get_cache_key(text, normalize)
+                # Добавляем в кэш (ключи уже посчитаны при проверке) и результаты
+                for cache_key, embedding in zip(uncached_keys, new_embeddings):
                     self.cache[cache_key] = embedding
-                    batch_embeddings.append((idx, embedding))
+                batch_embeddings.extend(zip(uncached_indices, new_embeddings))
             
             # Сортируем по индексу и добавляем к результатам
             batch_embeddings.sort(key=lambda x: x[0])
@@ -4,11 +4,33 @@
 """
 
 import numpy as np
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Union
 import logging
 import pickle
+import json
 from pathlib import Path
 
+from .vector_models import MetadataSoA
+from ._topk import top_k_desc
+
+try:
+    import simsimd
+    SIMSIMD_AVAILABLE = True
+except ImportError:
+    SIMSIMD_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Бюджет плитки строк при numpy поиске - порядка L2 кэша ядра
+_TILE_BYTES = 1 << 20
+
+# Первые байты кадра zstd - по ним load отличает сжатый JSON от несжатого и от pickle
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,12 +40,33 @@ class ImprovedVectorStore:
     Fallback на numpy если FAISS недоступен
     """
     
-    def __init__(self, use_faiss: bool = True, metric: str = "cosine"):
+    def __init__(self, use_faiss: bool = True, metric: str = "cosine",
+                 precision: str = "fp32", use_gpu: bool = False):
+        """
+        Args:
+            use_faiss: Использовать FAISS если установлен
+            metric: Метрика сходства (cosine / l2)
+            precision: Точность хранения векторов (fp32 / fp16 / int8).
+                fp16 вдвое сокращает память и трафик при скане, запросы остаются fp32;
+                int8 (только cosine, numpy fallback) - вчетверо, симметричная шкала 127.
+                В numpy fallback выигрыш по трафику есть только с simsimd: без него
+                каждая плитка перед умножением приводится к fp32
+            use_gpu: Держать плоские FAISS индексы на GPU (нужен faiss-gpu)
+        """
+        if precision == "int8" and metric != "cosine":
+            logger.warning("int8 хранение поддерживается только для cosine, используем fp16")
+            precision = "fp16"
+        
         self.metric = metric
         self.use_faiss = use_faiss
+        self.precision = precision
+        self.dtype = {"fp16": np.float16, "int8": np.int8}.get(precision, np.float32)
+        # Масштаб квантования: нормированные компоненты [-1, 1] -> [-127, 127]
+        self._scale = 127.0 if precision == "int8" else 1.0
         
         # Пробуем инициализировать FAISS
         self.faiss_available = False
+        self.gpu_resources = None
         self.faiss_indices = {}  # dialogue_id -> faiss index
         
         if use_faiss:
@@ -32,14 +75,32 @@ class ImprovedVectorStore:
                 self.faiss = faiss
                 self.faiss_available = True
                 logger.info("FAISS успешно инициализирован")
+                
+                # brute-force поиск на GPU: GEMM + выбор топ-k на тензорных ядрах
+                if use_gpu and hasattr(faiss, 'StandardGpuResources') and faiss.get_num_gpus() > 0:
+                    self.gpu_resources = faiss.StandardGpuResources()
+                    logger.info("FAISS индексы будут размещаться на GPU")
+                elif use_gpu:
+                    logger.warning("FAISS без поддержки GPU, индексы остаются на CPU")
             except ImportError:
                 logger.warning("FAISS не установлен, используем numpy fallback")
                 self.faiss_available = False
         
+        if self.faiss_available and precision == "int8":
+            logger.warning("int8 хранение в FAISS недоступно, индекс хранит fp16")
+        elif not self.faiss_available and self.dtype != np.float32 and not SIMSIMD_AVAILABLE:
+            logger.warning(f"{precision} хранение без simsimd экономит только память: "
+                           f"скан приводит каждую плитку к fp32")
+        
         # Fallback хранилища
-        self.numpy_vectors = {}  # dialogue_id -> vectors
+        self.numpy_vectors = {}  # dialogue_id -> vectors (view на заполненную часть буфера)
+        # Предвыделенные буферы numpy fallback с геометрическим ростом
+        self._vector_buffers = {}  # dialogue_id -> (capacity x dim)
+        self._vector_counts = {}   # dialogue_id -> заполнено строк
+        # Векторы, ждущие обучения IVF-индекса: dialogue_id -> (буфер, заполнено)
+        self._pending_vectors = {}
         self.texts = {}  # dialogue_id -> texts
-        self.metadata = {}  # dialogue_id -> metadata
+        self.metadata = {}  # dialogue_id -> MetadataSoA
         
         # Размерность векторов (для rubert-tiny2)
         self.dim = 312
@@ -67,10 +128,19 @@ class ImprovedVectorStore:
             
             if n_clusters < 10:
                 # Простой индекс для малых данных
-                if self.metric == "cosine":
+                if self.precision in ("fp16", "int8"):
+                    # fp16 хранение, накопление в fp32 (int8 в FAISS без обучения
+                    # шкалы недоступен - берём ближайший вариант)
+                    faiss_metric = (self.faiss.METRIC_INNER_PRODUCT if self.metric == "cosine"
+                                    else self.faiss.METRIC_L2)
+                    index = self.faiss.IndexScalarQuantizer(
+                        self.dim, self.faiss.ScalarQuantizer.QT_fp16, faiss_metric
+                    )
+                elif self.metric == "cosine":
                     index = self.faiss.IndexFlatIP(self.dim)  # Inner Product для косинусного
                 else:
                     index = self.faiss.IndexFlatL2(self.dim)  # L2 для евклидова
+                index = self._to_gpu(index)
             else:
                 # Квантизованный индекс для больших данных
                 quantizer = self.faiss.IndexFlatL2(self.dim)
@@ -93,8 +163,37 @@ class ImprovedVectorStore:
         
         return self.faiss_indices[dialogue_id]
     
+    def _to_gpu(self, index):
+        """
+        Переносит плоский индекс на GPU, если он включён
+        IndexFlatIP/IndexFlatL2 клонируются как есть. У IndexScalarQuantizer(fp16)
+        GPU-версии нет - вместо него GpuIndexFlat с fp16 хранением.
+        Остальные индексы остаются на CPU.
+        """
+        if self.gpu_resources is None:
+            return index
+        
+        if isinstance(index, (self.faiss.IndexFlatIP, self.faiss.IndexFlatL2)):
+            return self.faiss.index_cpu_to_gpu(self.gpu_resources, 0, index)
+        
+        if (isinstance(index, self.faiss.IndexScalarQuantizer)
+                and index.sq.qtype == self.faiss.ScalarQuantizer.QT_fp16):
+            config = self.faiss.GpuIndexFlatConfig()
+            config.device = 0
+            config.useFloat16 = True
+            gpu_index = self.faiss.GpuIndexFlat(
+                self.gpu_resources, index.d, index.metric_type, config
+            )
+            if index.ntotal:
+                gpu_index.add(index.reconstruct_n(0, index.ntotal))
+            return gpu_index
+        
+        return index
+    
     def add_batch(self, dialogue_id: str, vectors: np.ndarray,
-                  texts: List[str], metadata: List[Dict] = None):
+                  texts: List[str],
+                  metadata: Union[MetadataSoA, List[Dict], None] = None,
+                  normalized: bool = False):
         """
         Добавляет батч векторов в хранилище
         
@@ -102,35 +201,40 @@ class ImprovedVectorStore:
             dialogue_id: ID диалога
             vectors: Матрица векторов (N x dim)
             texts: Список текстов
-            metadata: Список метаданных
+            metadata: Метаданные в виде MetadataSoA или списка словарей
+            normalized: Векторы уже единичной длины - нормализация пропускается
         """
         if len(vectors) != len(texts):
             raise ValueError("Количество векторов должно совпадать с текстами")
         
+        if metadata is None:
+            metadata = MetadataSoA.from_dicts([{}] * len(texts))
+        elif not isinstance(metadata, MetadataSoA):
+            metadata = MetadataSoA.from_dicts(metadata)
+        
+        if len(metadata) != len(texts):
+            raise ValueError("Количество метаданных должно совпадать с текстами")
+        
         # Сохраняем тексты и метаданные
         if dialogue_id not in self.texts:
             self.texts[dialogue_id] = []
-            self.metadata[dialogue_id] = []
+            self.metadata[dialogue_id] = MetadataSoA()
             self.stats['dialogues'] += 1
         
         self.texts[dialogue_id].extend(texts)
+        self.metadata[dialogue_id].extend(metadata)
         
-        if metadata:
-            self.metadata[dialogue_id].extend(metadata)
-        else:
-            self.metadata[dialogue_id].extend([{}] * len(texts))
+        # Нормализуем один раз при добавлении - косинус сводится к скалярному
+        # произведению и в FAISS, и в numpy fallback
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.metric == "cosine" and not normalized:
+            vectors = self._normalize_rows(vectors)
         
         # Добавляем векторы
         if self.faiss_available and self.use_faiss:
-            # Используем FAISS
+            # Используем FAISS (на вход всегда fp32, хранение по self.precision)
             index = self._create_faiss_index(dialogue_id)
             
-            # Нормализуем для косинусного сходства
-            if self.metric == "cosine":
-                # Нормализация для Inner Product = Cosine Similarity
-                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
-                vectors = vectors / (norms + 1e-8)
-            
             # Обучаем индекс если нужно
             if hasattr(index, 'is_trained') and not index.is_trained:
                 if len(vectors) >= 100:
@@ -139,22 +243,17 @@ class ImprovedVectorStore:
                     index.is_trained = True
                     logger.info(f"FAISS индекс обучен для {dialogue_id}")
                 else:
-                    # Накапливаем векторы для обучения
-                    if dialogue_id not in self.numpy_vectors:
-                        self.numpy_vectors[dialogue_id] = []
-                    self.numpy_vectors[dialogue_id].append(vectors)
-                    
-                    # Проверяем, достаточно ли векторов
-                    total_vecs = sum(len(v) for v in self.numpy_vectors[dialogue_id])
-                    if total_vecs >= 100:
+                    # Накапливаем векторы для обучения в растущем буфере
+                    # (без пересборки списка и vstack на каждом батче)
+                    pending = self._append_pending(dialogue_id, vectors)
+                    if len(pending) >= 100:
                         # Обучаем на всех накопленных
-                        all_vecs = np.vstack(self.numpy_vectors[dialogue_id])
-                        index.train(all_vecs)
+                        index.train(pending)
                         index.is_trained = True
-                        index.add(all_vecs)
+                        index.add(pending)
                         # Очищаем временное хранилище
-                        del self.numpy_vectors[dialogue_id]
-                        logger.info(f"FAISS индекс обучен на {total_vecs} векторах")
+                        del self._pending_vectors[dialogue_id]
+                        logger.info(f"FAISS индекс обучен на {len(pending)} векторах")
                     
                     self.stats['total_vectors'] += len(vectors)
                     return  # Не добавляем пока не обучен
@@ -164,19 +263,63 @@ class ImprovedVectorStore:
             
         else:
             # Fallback на numpy
-            if dialogue_id not in self.numpy_vectors:
-                self.numpy_vectors[dialogue_id] = vectors
-            else:
-                self.numpy_vectors[dialogue_id] = np.vstack([
-                    self.numpy_vectors[dialogue_id],
-                    vectors
-                ])
+            self._append_vectors(dialogue_id, vectors)
         
         self.stats['total_vectors'] += len(vectors)
         logger.debug(f"Добавлено {len(vectors)} векторов для {dialogue_id}")
     
+    @staticmethod
+    def _grow_buffer(buffer: Optional[np.ndarray], count: int, vectors: np.ndarray,
+                     dtype) -> np.ndarray:
+        """
+        Дописывает векторы после count заполненных строк буфера.
+        Ёмкость растёт геометрически - амортизированно O(1) на вектор вместо vstack
+        """
+        needed = count + len(vectors)
+        if buffer is None or needed > len(buffer):
+            capacity = max(needed, 2 * (len(buffer) if buffer is not None else 0), 64)
+            new_buffer = np.empty((capacity, vectors.shape[1]), dtype=dtype)
+            if count:
+                new_buffer[:count] = buffer[:count]
+            buffer = new_buffer
+        buffer[count:needed] = vectors
+        return buffer
+    
+    @staticmethod
+    def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+        """L2-нормализация строк: квадраты норм одним einsum, один sqrt на строку"""
+        sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+        return vectors / (np.sqrt(sq_norms)[:, np.newaxis] + 1e-8)
+    
+    def _to_storage(self, vectors: np.ndarray) -> np.ndarray:
+        """Приводит нормированные fp32-векторы к dtype хранения"""
+        if self.dtype == np.int8:
+            return np.clip(np.rint(vectors * self._scale), -127, 127).astype(np.int8)
+        return vectors.astype(self.dtype, copy=False)
+    
+    def _append_vectors(self, dialogue_id: str, vectors: np.ndarray):
+        """Дописывает векторы в непрерывный буфер диалога (numpy fallback)"""
+        vectors = self._to_storage(vectors)
+        count = self._vector_counts.get(dialogue_id, 0)
+        buffer = self._grow_buffer(
+            self._vector_buffers.get(dialogue_id), count, vectors, self.dtype
+        )
+        needed = count + len(vectors)
+        self._vector_buffers[dialogue_id] = buffer
+        self._vector_counts[dialogue_id] = needed
+        self.numpy_vectors[dialogue_id] = buffer[:needed]
+    
+    def _append_pending(self, dialogue_id: str, vectors: np.ndarray) -> np.ndarray:
+        """Копит fp32-векторы до обучения FAISS индекса, возвращает накопленные"""
+        buffer, count = self._pending_vectors.get(dialogue_id, (None, 0))
+        buffer = self._grow_buffer(buffer, count, vectors, np.float32)
+        count += len(vectors)
+        self._pending_vectors[dialogue_id] = (buffer, count)
+        return buffer[:count]
+    
     def search(self, dialogue_id: str, query_vector: np.ndarray,
-              top_k: int = 5, threshold: float = None) -> List[Dict]:
+              top_k: int = 5, threshold: float = None,
+              query_is_normalized: bool = False) -> List[Dict]:
         """
         Поиск похожих векторов
         
@@ -185,21 +328,52 @@ class ImprovedVectorStore:
             query_vector: Вектор запроса (1D array)
             top_k: Количество результатов
             threshold: Минимальный порог сходства
+            query_is_normalized: Запрос уже единичной длины
         
         Returns:
             Список результатов с текстами и scores
         """
-        self.stats['total_searches'] += 1
+        query_vectors = np.asarray(query_vector).reshape(1, -1)
+        return self.search_batch(dialogue_id, query_vectors, top_k, threshold,
+                                 query_is_normalized)[0]
+    
+    def search_batch(self, dialogue_id: str, query_vectors: np.ndarray,
+                     top_k: int = 5, threshold: float = None,
+                     query_is_normalized: bool = False) -> List[List[Dict]]:
+        """
+        Поиск для нескольких запросов за один проход по индексу
+        
+        Args:
+            dialogue_id: ID диалога
+            query_vectors: Матрица запросов (Q x dim)
+            top_k: Количество результатов на запрос
+            threshold: Минимальный порог сходства
+            query_is_normalized: Запросы уже единичной длины - для косинуса
+                остаётся чистое скалярное произведение
+        
+        Returns:
+            Списки результатов для каждого запроса
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        if query_vectors.ndim == 1:
+            query_vectors = query_vectors.reshape(1, -1)
+        n_queries = len(query_vectors)
+        
+        self.stats['total_searches'] += n_queries
         
         if dialogue_id not in self.texts:
             logger.debug(f"Диалог {dialogue_id} не найден")
-            return []
+            return [[] for _ in range(n_queries)]
         
         texts = self.texts[dialogue_id]
         metadata = self.metadata[dialogue_id]
         
         if not texts:
-            return []
+            return [[] for _ in range(n_queries)]
+        
+        # Нормализуем запросы один раз - для FAISS и для numpy
+        if self.metric == "cosine" and not query_is_normalized:
+            query_vectors = self._normalize_rows(query_vectors)
         
         # Поиск через FAISS
         if self.faiss_available and dialogue_id in self.faiss_indices:
@@ -207,89 +381,139 @@ class ImprovedVectorStore:
             
             # Проверяем что индекс не пустой
             if index.ntotal == 0:
-                return []
-            
-            # Нормализуем запрос для косинусного сходства
-            if self.metric == "cosine":
-                query_norm = np.linalg.norm(query_vector)
-                query_vector = query_vector / (query_norm + 1e-8)
-            
-            # Reshape для FAISS (нужна 2D матрица)
-            query_vector = query_vector.reshape(1, -1).astype(np.float32)
+                return [[] for _ in range(n_queries)]
             
             # Поиск
             if hasattr(index, 'nprobe'):
                 # Для IVF индексов увеличиваем точность поиска
                 index.nprobe = min(10, index.nlist)
             
-            distances, indices = index.search(query_vector, min(top_k, index.ntotal))
+            distances, indices = index.search(
+                np.ascontiguousarray(query_vectors), min(top_k, index.ntotal)
+            )
             
             # Формируем результаты
-            results = []
-            for dist, idx in zip(distances[0], indices[0]):
-                if idx >= 0 and idx < len(texts):  # Валидный индекс
-                    # Конвертируем расстояние в сходство
-                    if self.metric == "cosine":
-                        score = float(dist)  # Inner product уже даёт сходство
-                    else:
-                        score = 1.0 / (1.0 + float(dist))  # Инвертируем расстояние
-                    
-                    # Применяем порог
-                    if threshold and score < threshold:
-                        continue
-                    
-                    results.append({
-                        'text': texts[idx],
-                        'score': score,
-                        'metadata': metadata[idx],
-                        'index': int(idx)
-                    })
+            batch_results = []
+            for row_dist, row_idx in zip(distances, indices):
+                results = []
+                for dist, idx in zip(row_dist, row_idx):
+                    if idx >= 0 and idx < len(texts):  # Валидный индекс
+                        # Конвертируем расстояние в сходство
+                        if self.metric == "cosine":
+                            score = float(dist)  # Inner product уже даёт сходство
+                        else:
+                            score = 1.0 / (1.0 + float(dist))  # Инвертируем расстояние
+                        
+                        # Применяем порог
+                        if threshold and score < threshold:
+                            continue
+                        
+                        results.append({
+                            'text': texts[idx],
+                            'score': score,
+                            'metadata': metadata.row(idx),
+                            'index': int(idx)
+                        })
+                batch_results.append(results)
             
-            return results
+            return batch_results
         
         # Fallback на numpy поиск
         elif dialogue_id in self.numpy_vectors:
             vectors = self.numpy_vectors[dialogue_id]
             
-            # Вычисляем сходство
-            if self.metric == "cosine":
-                # Косинусное сходство
-                query_norm = query_vector / (np.linalg.norm(query_vector) + 1e-8)
-                vectors_norm = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-8)
-                scores = np.dot(vectors_norm, query_norm)
-            else:
-                # Евклидово расстояние
-                distances = np.linalg.norm(vectors - query_vector, axis=1)
-                scores = 1.0 / (1.0 + distances)
-            
-            # Применяем порог
-            if threshold:
-                valid_idx = np.where(scores >= threshold)[0]
-            else:
-                valid_idx = np.arange(len(scores))
-            
-            if len(valid_idx) == 0:
-                return []
+            batch_results = []
+            # Топ-k по всей строке для всех запросов разом: порог монотонен
+            # по score, поэтому топ-k среди прошедших порог - это топ-k,
+            # обрезанный порогом, и выборка подмножества не нужна
+            top_indices, top_scores = self._numpy_top_k(
+                query_vectors, vectors, min(top_k, len(vectors))
+            )
             
-            # Топ-k
-            k = min(top_k, len(valid_idx))
-            top_indices = np.argpartition(scores[valid_idx], -k)[-k:]
-            top_indices = valid_idx[top_indices]
-            top_indices = top_indices[np.argsort(scores[top_indices])[::-1]]
-            
-            # Результаты
-            results = []
-            for idx in top_indices:
-                results.append({
-                    'text': texts[idx],
-                    'score': float(scores[idx]),
-                    'metadata': metadata[idx],
-                    'index': int(idx)
-                })
+            for row_indices, row_scores in zip(top_indices, top_scores):
+                # Применяем порог
+                if threshold:
+                    keep = row_scores >= threshold
+                    row_indices, row_scores = row_indices[keep], row_scores[keep]
+                
+                # Результаты
+                batch_results.append([
+                    {
+                        'text': texts[idx],
+                        'score': score,
+                        'metadata': metadata.row(idx),
+                        'index': idx
+                    }
+                    for idx, score in zip(row_indices.tolist(), row_scores.tolist())
+                ])
             
-            return results
+            return batch_results
+        
+        return [[] for _ in range(n_queries)]
+    
+    def _numpy_top_k(self, query_vectors: np.ndarray, vectors: np.ndarray, k: int):
+        """
+        Топ-k для всех запросов по матрице векторов (numpy fallback).
+        Большие матрицы обходятся плитками по _TILE_BYTES: плитка строк остаётся
+        в кэше, пока по ней считаются все запросы батча, а вместо матрицы Q x N
+        держим только кандидатов Q x k с каждой плитки
+        """
+        tile_rows = max(256, _TILE_BYTES // max(1, vectors[0].nbytes))
+        if len(vectors) <= tile_rows:
+            return top_k_desc(self._score_block(query_vectors, vectors), k)
+        
+        cand_indices, cand_scores = [], []
+        for start in range(0, len(vectors), tile_rows):
+            block_scores = self._score_block(query_vectors, vectors[start:start + tile_rows])
+            indices, scores = top_k_desc(block_scores, min(k, block_scores.shape[1]))
+            cand_indices.append(indices + start)
+            cand_scores.append(scores)
+        
+        # Слияние кандидатов плиток: топ-k из (число плиток x k) на запрос
+        cand_indices = np.concatenate(cand_indices, axis=1)
+        order, top_scores = top_k_desc(np.concatenate(cand_scores, axis=1), k)
+        return np.take_along_axis(cand_indices, order, axis=1), top_scores
+    
+    def _score_block(self, query_vectors: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        """Матрица сходства запросов с блоком хранимых векторов (Q x N)"""
+        if self.metric == "cosine":
+            # Косинусное сходство: векторы нормализованы при добавлении,
+            # запросы - один раз в начале поиска
+            if SIMSIMD_AVAILABLE:
+                # SIMD-ядра прямо по хранимому dtype, без апкаста матрицы в fp32
+                all_scores = np.asarray(simsimd.cdist(
+                    self._to_storage(query_vectors), vectors,
+                    metric='inner', out_dtype='float32'
+                ))
+                if self._scale != 1.0:
+                    all_scores /= self._scale * self._scale
+            else:
+                all_scores = query_vectors @ vectors.T.astype(np.float32, copy=False)
+                if self._scale != 1.0:
+                    all_scores /= self._scale
+            return all_scores
         
-        return []
+        # Евклидово расстояние
+        if SIMSIMD_AVAILABLE:
+            distances = np.sqrt(np.asarray(simsimd.cdist(
+                query_vectors.astype(vectors.dtype, copy=False), vectors,
+                metric='sqeuclidean', out_dtype='float32'
+            )))
+        else:
+            # ||q - v||^2 = ||q||^2 + ||v||^2 - 2 q.v: один GEMM вместо
+            # временного тензора разностей (Q x N x dim)
+            vectors32 = vectors.astype(np.float32, copy=False)
+            sq_dist = (
+                np.einsum('ij,ij->i', query_vectors, query_vectors)[:, np.newaxis]
+                + np.einsum('ij,ij->i', vectors32, vectors32)[np.newaxis, :]
+                - 2.0 * (query_vectors @ vectors32.T)
+            )
+            distances = np.sqrt(np.maximum(sq_dist, 0.0))
+        return 1.0 / (1.0 + distances)
+    
+    def get_metadata(self, dialogue_id: str) -> Optional[MetadataSoA]:
+        """Возвращает столбцы метаданных диалога"""
+        return self.metadata.get(dialogue_id)
     
     def clear_dialogue(self, dialogue_id: str):
         """Очищает данные диалога"""
@@ -299,6 +523,9 @@ class ImprovedVectorStore:
         
         if dialogue_id in self.numpy_vectors:
             del self.numpy_vectors[dialogue_id]
+        self._vector_buffers.pop(dialogue_id, None)
+        self._vector_counts.pop(dialogue_id, None)
+        self._pending_vectors.pop(dialogue_id, None)
         
         if dialogue_id in self.faiss_indices:
             del self.faiss_indices[dialogue_id]
@@ -312,20 +539,39 @@ class ImprovedVectorStore:
             filepath = Path(filepath)
             filepath.parent.mkdir(parents=True, exist_ok=True)
             
+            metadata = self.metadata.get(dialogue_id, MetadataSoA())
             data = {
                 'texts': self.texts.get(dialogue_id, []),
-                'metadata': self.metadata.get(dialogue_id, []),
-                'metric': self.metric
+                'session_ids': metadata.session_ids,
+                'metric': self.metric,
+                # Векторы numpy fallback уже в формате хранения: load(mmap=True)
+                # может отобразить .npy без пересчёта
+                'precision': self.precision,
+                'normalized': self.metric == "cosine"
             }
             
-            # Сохраняем основные данные
+            # Тексты - JSON (zstd если доступен), числовые столбцы метаданных -
+            # .npz без поэлементной сериализации pickle
+            payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            if ZSTD_AVAILABLE:
+                payload = zstandard.ZstdCompressor(level=3).compress(payload)
             with open(filepath, 'wb') as f:
-                pickle.dump(data, f)
+                f.write(payload)
+            
+            np.savez(
+                filepath.with_suffix('.meta.npz'),
+                msg_idx=metadata.msg_idx,
+                chunk_idx=metadata.chunk_idx,
+                priority=metadata.priority
+            )
             
             # Сохраняем FAISS индекс отдельно
             if self.faiss_available and dialogue_id in self.faiss_indices:
                 index_path = filepath.with_suffix('.faiss')
-                self.faiss.write_index(self.faiss_indices[dialogue_id], str(index_path))
+                index = self.faiss_indices[dialogue_id]
+                if self.gpu_resources is not None and hasattr(index, 'getDevice'):
+                    index = self.faiss.index_gpu_to_cpu(index)
+                self.faiss.write_index(index, str(index_path))
                 logger.info(f"FAISS индекс сохранён: {index_path}")
             
             # Или numpy векторы
@@ -340,30 +586,81 @@ class ImprovedVectorStore:
             logger.error(f"Ошибка сохранения: {e}")
             return False
     
-    def load(self, dialogue_id: str, filepath: str) -> bool:
-        """Загружает индекс с диска"""
+    def load(self, dialogue_id: str, filepath: str, mmap: bool = False) -> bool:
+        """
+        Загружает индекс с диска
+        
+        Args:
+            dialogue_id: ID диалога
+            filepath: Путь к снапшоту
+            mmap: Отобразить векторы numpy fallback в память (read-only) вместо
+                чтения в RAM - процессы-воркеры делят страницы через page cache.
+                Первая же дозапись копирует буфер в обычную память
+        """
         try:
             filepath = Path(filepath)
             
             # Загружаем основные данные
             with open(filepath, 'rb') as f:
-                data = pickle.load(f)
+                payload = f.read()
+            
+            if payload.startswith(_ZSTD_MAGIC):
+                payload = zstandard.ZstdDecompressor().decompress(payload)
+            
+            if payload.startswith(b'{'):
+                data = json.loads(payload)
+                with np.load(filepath.with_suffix('.meta.npz')) as columns:
+                    metadata = MetadataSoA(
+                        session_ids=data['session_ids'],
+                        msg_idx=columns['msg_idx'],
+                        chunk_idx=columns['chunk_idx'],
+                        priority=columns['priority']
+                    )
+            else:
+                # Старый формат - pickle
+                data = pickle.loads(payload)
+                metadata = data['metadata']
+                if not isinstance(metadata, MetadataSoA):
+                    metadata = MetadataSoA.from_dicts(metadata)
             
             self.texts[dialogue_id] = data['texts']
-            self.metadata[dialogue_id] = data['metadata']
+            self.metadata[dialogue_id] = metadata
             
             # Пробуем загрузить FAISS индекс
             if self.faiss_available:
                 index_path = filepath.with_suffix('.faiss')
                 if index_path.exists():
-                    self.faiss_indices[dialogue_id] = self.faiss.read_index(str(index_path))
+                    index = self.faiss.read_index(str(index_path))
+                    # На GPU уходят только плоские индексы (IVF-PQ остаётся на CPU)
+                    if isinstance(index, (self.faiss.IndexFlatIP, self.faiss.IndexFlatL2,
+                                          self.faiss.IndexScalarQuantizer)):
+                        index = self._to_gpu(index)
+                    self.faiss_indices[dialogue_id] = index
                     logger.info(f"FAISS индекс загружен: {index_path}")
                     return True
             
             # Или numpy векторы
             vectors_path = filepath.with_suffix('.npy')
             if vectors_path.exists():
-                self.numpy_vectors[dialogue_id] = np.load(vectors_path)
+                vectors = np.load(vectors_path, mmap_mode='r' if mmap else None)
+                if (mmap and vectors.dtype == self.dtype
+                        and data.get('precision', self.precision) == self.precision
+                        and (self.metric != "cosine" or data.get('normalized'))):
+                    # Снапшот уже в формате хранения - используем отображение как
+                    # буфер с ёмкостью ровно по размеру, без копии
+                    self._vector_buffers[dialogue_id] = vectors
+                    self._vector_counts[dialogue_id] = len(vectors)
+                    self.numpy_vectors[dialogue_id] = vectors
+                    logger.info(f"Векторы отображены в память: {vectors_path}")
+                    return True
+                
+                vectors = np.asarray(vectors).astype(np.float32, copy=False)
+                if self.metric == "cosine":
+                    # Старые снапшоты хранили ненормализованные векторы
+                    vectors = self._normalize_rows(vectors)
+                self._vector_buffers.pop(dialogue_id, None)
+                self._vector_counts.pop(dialogue_id, None)
+                self._append_vectors(dialogue_id, vectors)
                 logger.info(f"Векторы загружены: {vectors_path}")
                 return True
             
@@ -5,6 +5,7 @@
 
 from core.interfaces import IEmbeddingEngine, ProcessingResult
 from typing import Dict, Any, List, Optional, Tuple
+from array import array
 import numpy as np
 import hashlib
 import re
@@ -12,12 +13,23 @@ import time
 import logging
 from collections import defaultdict
 
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+from .vector_models import MetadataSoA
+
 logger = logging.getLogger(__name__)
 
 
 class EmbeddingsModule(IEmbeddingEngine):
     """Модуль эмбеддингов - координирует engine и store"""
     
+    # Разделитель предложений для чанкинга
+    _SENT_RE = re.compile(r'(?<=[.!?])\s+')
+    
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.model_name = config.get('model_name', 'cointegrated/rubert-tiny2')
@@ -70,6 +82,32 @@ class EmbeddingsModule(IEmbeddingEngine):
             'consectetur adipiscing', 'dolor sit amet'
         ]
         
+        # Слова-признаки полезного контекста для длинных текстов
+        self.useful_words = [
+            'я', 'мой', 'моя', 'меня', 'мне', 'мною',
+            'хочу', 'буду', 'делаю', 'думаю', 'считаю',
+            'нужно', 'важно', 'интересно', 'сложно'
+        ]
+        
+        # Компилируем наборы паттернов в одну альтернацию - один проход по тексту
+        self._personal_re = re.compile(
+            '|'.join(f'(?:{p})' for p in self.personal_patterns), re.IGNORECASE
+        )
+        self._stop_re = re.compile('|'.join(re.escape(p) for p in self.stop_phrases))
+        self._useful_re = re.compile('|'.join(re.escape(w) for w in self.useful_words))
+        # Топ паттерны для приоритизации сессий
+        self._top_personal_re = re.compile(
+            '|'.join(f'(?:{p})' for p in self.personal_patterns[:10])
+        )
+        
+        # Фильтр, специализированный под текущие паттерны и пороги
+        self._text_filter = self._build_text_filter()
+        
+        # Тексты в нижнем регистре по диалогам: (список texts хранилища, lowercase).
+        # Запись действительна, пока хранилище держит тот же список той же длины -
+        # прямые clear_dialogue/load/add_batch хранилища делают её устаревшей
+        self._text_lower: Dict[str, Tuple[List[str], List[str]]] = {}
+        
         self.stats = {
             'indexed': 0,
             'filtered': 0,
@@ -90,7 +128,9 @@ class EmbeddingsModule(IEmbeddingEngine):
             # Используем улучшенное хранилище с FAISS
             self.vector_store = ImprovedVectorStore(
                 use_faiss=self.config.get('use_faiss', True),
-                metric=self.config.get('metric', 'cosine')
+                metric=self.config.get('metric', 'cosine'),
+                precision=self.config.get('precision', 'fp32'),
+                use_gpu=self.config.get('faiss_gpu', False)
             )
     
     def set_dependencies(self, optimizer=None, storage=None, embeddings=None):
@@ -102,117 +142,102 @@ class EmbeddingsModule(IEmbeddingEngine):
         Фильтрация мусора - КРИТИЧЕСКАЯ функция!
         Возвращает True если текст стоит индексировать
         """
-        # Проверка длины
-        if len(text) > self.max_text_length or len(text) < 10:
-            self.stats['filtered'] += 1
-            return False
-        
-        # Проверка на копипаст
-        text_lower = text.lower()
-        for stop in self.stop_phrases:
-            if stop in text_lower:
-                self.stats['filtered'] += 1
-                return False
+        return bool(self._filter_batch([text])[0])
+    
+    def _filter_batch(self, contents: List[str],
+                      contents_lower: Optional[List[str]] = None) -> np.ndarray:
+        """
+        Пакетная фильтрация мусора - один вызов на весь диалог
+        Возвращает булеву маску текстов, которые стоит индексировать
         
-        # Проверка энтропии (повторяемость)
-        entropy = self._calculate_entropy(text)
-        if entropy < self.min_entropy:
-            self.stats['filtered'] += 1
-            return False
+        Args:
+            contents: Тексты сообщений
+            contents_lower: Те же тексты в нижнем регистре, если уже посчитаны
+        """
+        n = len(contents)
+        if contents_lower is None:
+            contents_lower = [text.lower() for text in contents]
         
-        # Проверка на личную информацию - всегда индексируем!
-        for pattern in self.personal_patterns:
-            if re.search(pattern, text_lower, re.IGNORECASE):
-                return True
+        # Проверка длины - векторно для всего батча
+        lengths = np.fromiter(map(len, contents), dtype=np.int64, count=n)
+        mask = (lengths <= self.max_text_length) & (lengths >= 10)
         
-        # Проверка на полезный контекст
-        useful_words = [
-            'я', 'мой', 'моя', 'меня', 'мне', 'мною',
-            'хочу', 'буду', 'делаю', 'думаю', 'считаю',
-            'нужно', 'важно', 'интересно', 'сложно'
-        ]
-        
-        # Если нет полезных слов в длинном тексте - вероятно мусор
-        if len(text) > 500:
-            if not any(word in text_lower for word in useful_words):
-                self.stats['filtered'] += 1
-                return False
+        text_filter = self._text_filter
+        for i in np.flatnonzero(mask).tolist():
+            if not text_filter(contents_lower[i], lengths[i]):
+                mask[i] = False
         
-        return True
+        self.stats['filtered'] += n - int(np.count_nonzero(mask))
+        return mask
     
-    def _calculate_entropy(self, text: str) -> float:
-        """Вычисляет энтропию для определения повторяемости"""
-        if not text:
-            return 0.0
+    def _build_text_filter(self):
+        """
+        Строит фильтр, специализированный под текущий набор паттернов (частичное вычисление).
+        Регулярки, слова и пороги связываются в замыкании - в горячем цикле
+        нет обращений к атрибутам self.
+        При изменении паттернов или порогов фильтр нужно пересобрать.
+        """
+        stop_search = self._stop_re.search
+        personal_search = self._personal_re.search
+        useful_search = self._useful_re.search
+        min_entropy = self.min_entropy
         
-        # Считаем уникальные слова
-        words = text.lower().split()
-        if not words:
-            return 0.0
+        def text_filter(text_lower: str, length: int) -> bool:
+            # Проверка на копипаст
+            if stop_search(text_lower):
+                return False
+            
+            # Проверка энтропии (повторяемость)
+            words = text_lower.split()
+            if not words or len(set(words)) / len(words) < min_entropy:
+                return False
+            
+            # Проверка на личную информацию - всегда индексируем!
+            if personal_search(text_lower):
+                return True
+            
+            # Если нет полезных слов в длинном тексте - вероятно мусор
+            if length > 500 and not useful_search(text_lower):
+                return False
+            
+            return True
         
-        unique_ratio = len(set(words)) / len(words)
-        return unique_ratio
+        return text_filter
     
     def _smart_chunk(self, text: str, size: int = 300) -> List[str]:
         """Умное разбиение с оверлапом"""
         if len(text) <= size:
             return [text]
         
-        # Разбиваем по предложениям
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        # Границы предложений как (начало, конец) - без промежуточных строк
+        spans = []
+        start = 0
+        for match in self._SENT_RE.finditer(text):
+            spans.append((start, match.start()))
+            start = match.end()
+        spans.append((start, len(text)))
         
         chunks = []
-        current = []
+        first = 0  # Первое предложение текущего окна
         current_len = 0
         
-        for sent in sentences:
-            if current_len + len(sent) > size and current:
-                chunks.append(' '.join(current))
+        for i, (sent_start, sent_end) in enumerate(spans):
+            if current_len + (sent_end - sent_start) > size and i > first:
+                chunks.append(text[spans[first][0]:spans[i - 1][1]])
                 # Оверлап - берём последнее предложение
-                if len(current) > 1:
-                    current = [current[-1]]
-                    current_len = len(current[0])
+                if i - first > 1:
+                    first = i - 1
+                    current_len = spans[first][1] - spans[first][0]
                 else:
-                    current = []
+                    first = i
                     current_len = 0
             
-            current.append(sent)
-            current_len += len(sent)
+            current_len += sent_end - sent_start
         
-        if current:
-            chunks.append(' '.join(current))
+        chunks.append(text[spans[first][0]:spans[-1][1]])
         
         return chunks
     
-    def _prioritize_sessions(self, sessions: Dict) -> Dict[str, float]:
-        """Приоритизация сессий по важности"""
-        priorities = {}
-        
-        for sid, messages in sessions.items():
-            score = 0.0
-            text_len = 0
-            
-            # Анализируем контент
-            for msg in messages:
-                content = self._extract_content(msg)
-                text_len += len(content)
-                
-                # Проверяем личную информацию
-                for pattern in self.personal_patterns[:10]:  # Топ паттерны
-                    if re.search(pattern, content.lower()):
-                        score += 1.0
-                        break
-            
-            # Штраф за слишком длинные (копипаст)
-            if text_len > 5000:
-                score *= 0.5
-            elif text_len < 100:
-                score *= 0.8
-            
-            priorities[sid] = min(max(score / max(1, len(messages)), 0.0), 1.0)
-        
-        return priorities
-    
     def _extract_content(self, msg) -> str:
         """Извлечение текста из сообщения"""
         if hasattr(msg, 'content'):
@@ -232,71 +257,122 @@ class EmbeddingsModule(IEmbeddingEngine):
             indexed = 0
             skipped = 0
             
-            # Приоритизируем сессии
-            priorities = self._prioritize_sessions(sessions)
+            many_sessions = len(sessions) > 50
+            top_personal_search = self._top_personal_re.search
             
-            # Обрабатываем по приоритету
-            sorted_sessions = sorted(
-                sessions.items(),
-                key=lambda x: priorities.get(x[0], 0),
-                reverse=True
-            )
-            
-            all_texts = []
-            all_metadata = []
+            # Один проход по сессиям: текст, приоритет, фильтр и чанки
+            # считаются сразу, пока данные сессии горячие в кэше
+            session_blocks = []
             
-            for session_id, messages in sorted_sessions:
-                priority = priorities.get(session_id, 0)
+            for session_id, messages in sessions.items():
+                contents = [self._extract_content(msg) for msg in messages]
+                contents_lower = [c.lower() for c in contents]
+                
+                # Приоритет: доля сообщений с личной информацией
+                score = float(sum(1 for cl in contents_lower if top_personal_search(cl)))
+                text_len = sum(map(len, contents))
+                
+                # Штраф за слишком длинные (копипаст)
+                if text_len > 5000:
+                    score *= 0.5
+                elif text_len < 100:
+                    score *= 0.8
+                
+                priority = min(max(score / max(1, len(contents)), 0.0), 1.0)
                 
                 # Пропускаем неважные при большом объёме
-                if len(sessions) > 50 and priority < 0.3:
-                    skipped += len(messages)
+                if many_sessions and priority < 0.3:
+                    skipped += len(contents)
                     continue
                 
-                for msg_idx, msg in enumerate(messages):
-                    content = self._extract_content(msg)
-                    
-                    # ФИЛЬТРАЦИЯ!
-                    if not self.should_index_text(content):
-                        skipped += 1
-                        continue
+                # ФИЛЬТРАЦИЯ! Одним вызовом на сессию
+                keep = self._filter_batch(contents, contents_lower)
+                skipped += len(contents) - int(np.count_nonzero(keep))
+                
+                texts = []
+                texts_lower = []
+                msg_idx_buf = array('i')
+                chunk_idx_buf = array('i')
+                
+                for msg_idx in np.flatnonzero(keep).tolist():
+                    content = contents[msg_idx]
                     
                     # Чанки для длинных
                     if len(content) > 500:
                         chunks = self._smart_chunk(content)
+                        texts_lower.extend(chunk.lower() for chunk in chunks)
                     else:
                         chunks = [content]
+                        texts_lower.append(contents_lower[msg_idx])
                     
-                    for chunk_idx, chunk in enumerate(chunks):
-                        all_texts.append(chunk)
-                        all_metadata.append({
-                            'session_id': session_id,
-                            'msg_idx': msg_idx,
-                            'chunk_idx': chunk_idx,
-                            'priority': priority
-                        })
+                    n_chunks = len(chunks)
+                    texts.extend(chunks)
+                    msg_idx_buf.extend([msg_idx] * n_chunks)
+                    chunk_idx_buf.extend(range(n_chunks))
+                
+                session_blocks.append(
+                    (priority, session_id, texts, texts_lower, msg_idx_buf, chunk_idx_buf)
+                )
+            
+            # Важные сессии идут первыми
+            session_blocks.sort(key=lambda block: block[0], reverse=True)
+            
+            all_texts = []
+            all_texts_lower = []
+            # Метаданные копим столбцами (SoA), без словаря на каждый чанк
+            sid_list = []
+            msg_idx_buf = array('i')
+            chunk_idx_buf = array('i')
+            prio_buf = array('d')
+            
+            for priority, session_id, texts, texts_lower, msg_idx, chunk_idx in session_blocks:
+                n_chunks = len(texts)
+                all_texts.extend(texts)
+                all_texts_lower.extend(texts_lower)
+                sid_list.extend([session_id] * n_chunks)
+                msg_idx_buf.extend(msg_idx)
+                chunk_idx_buf.extend(chunk_idx)
+                prio_buf.extend([priority] * n_chunks)
             
             # Батчевое кодирование
             if all_texts:
                 if self.optimizer:
-                    # Через оптимизатор с кэшем
-                    cache_key = f"encode_{dialogue_id}"
-                    vectors = self.optimizer.cache_get(cache_key)
-                    
-                    if vectors is None:
-                        vectors = self.engine.encode_batch(all_texts)
-                        self.optimizer.cache_put(cache_key, vectors, ttl=3600)
+                    # Через оптимизатор с кэшем по содержимому чанков
+                    # (кэш может хранить fp16 - нормы уже не точно единичные)
+                    vectors = self._encode_with_optimizer_cache(all_texts)
+                    normalized = False
                 else:
                     vectors = self.engine.encode_batch(all_texts)
+                    normalized = True
+                
+                all_metadata = MetadataSoA(
+                    session_ids=sid_list,
+                    msg_idx=np.frombuffer(msg_idx_buf, dtype=np.int32),
+                    chunk_idx=np.frombuffer(chunk_idx_buf, dtype=np.int32),
+                    priority=np.frombuffer(prio_buf, dtype=np.float64)
+                )
                 
                 # Добавляем в хранилище
                 self.vector_store.add_batch(
                     dialogue_id=dialogue_id,
                     vectors=vectors,
                     texts=all_texts,
-                    metadata=all_metadata
+                    metadata=all_metadata,
+                    normalized=normalized
                 )
                 
+                # Нижний регистр храним на всё время жизни чанка; если кэш уже
+                # разошёлся с хранилищем, он пересоберётся при поиске
+                cached = self._text_lower.get(dialogue_id)
+                store_texts = self.vector_store.texts[dialogue_id]
+                if cached is None and len(store_texts) == len(all_texts_lower):
+                    self._text_lower[dialogue_id] = (store_texts, all_texts_lower)
+                elif (cached is not None and cached[0] is store_texts
+                        and len(cached[1]) + len(all_texts_lower) == len(store_texts)):
+                    cached[1].extend(all_texts_lower)
+                else:
+                    self._text_lower.pop(dialogue_id, None)
+                
                 indexed = len(vectors)
             
             elapsed = time.time() - start_time
@@ -312,6 +388,39 @@ class EmbeddingsModule(IEmbeddingEngine):
             logger.error(f"Ошибка индексации: {e}")
             return ProcessingResult(success=False, data={}, error=str(e))
     
+    def _encode_with_optimizer_cache(self, texts: List[str]) -> np.ndarray:
+        """
+        Кодирование через кэш оптимизатора с ключом по содержимому чанка.
+        Одинаковые чанки (в том числе из разных диалогов) кодируются один раз
+        """
+        keys = [self._chunk_cache_key(text) for text in texts]
+        
+        vectors_by_key = {}
+        missing = {}  # key -> text, только уникальные промахи
+        for key, text in zip(keys, texts):
+            if key in vectors_by_key or key in missing:
+                continue
+            vector = self.optimizer.cache_get(key)
+            if vector is None:
+                missing[key] = text
+            else:
+                vectors_by_key[key] = vector
+        
+        if missing:
+            new_vectors = self.engine.encode_batch(list(missing.values()))
+            for key, vector in zip(missing, new_vectors):
+                vectors_by_key[key] = vector
+                self.optimizer.cache_put(key, vector, ttl=3600)
+        
+        return np.stack([vectors_by_key[key] for key in keys])
+    
+    @staticmethod
+    def _chunk_cache_key(text: str) -> str:
+        """Ключ кэша эмбеддинга по содержимому текста"""
+        if XXHASH_AVAILABLE:
+            return f"emb_{xxhash.xxh3_64_intdigest(text.encode()):016x}"
+        return f"emb_{hashlib.blake2b(text.encode(), digest_size=8).hexdigest()}"
+    
     def hybrid_search(self, query: str, dialogue_id: str, 
                      keywords: List[str] = None) -> ProcessingResult:
         """Гибридный поиск: векторы + ключевые слова"""
@@ -322,33 +431,17 @@ class EmbeddingsModule(IEmbeddingEngine):
             if not keywords:
                 keywords = self._extract_keywords(query)
             
-            # Векторный поиск
-            query_vector = self.engine.encode_single(query)
+            # Векторный поиск: запросы почти не повторяются, кэш движка
+            # для них - лишний хэш и рост памяти
+            query_vector = self.engine.encode_single(query, use_cache=False)
             results = self.vector_store.search(
                 dialogue_id=dialogue_id,
                 query_vector=query_vector,
-                top_k=15
+                top_k=15,
+                query_is_normalized=True
             )
             
-            # Ранжирование с учётом ключевых слов
-            for result in results:
-                score = result['score']
-                text_lower = result['text'].lower()
-                
-                # Буст за ключевые слова
-                for kw in keywords:
-                    if kw.lower() in text_lower:
-                        score *= 1.2
-                
-                # Буст за приоритет
-                if result.get('metadata', {}).get('priority', 0) > 0.5:
-                    score *= 1.1
-                
-                result['final_score'] = score
-            
-            # Сортировка и топ-5
-            results.sort(key=lambda x: x['final_score'], reverse=True)
-            final_results = results[:5]
+            final_results = self._rank_results(dialogue_id, results, keywords)
             
             self.stats['searches'] += 1
             
@@ -361,12 +454,118 @@ class EmbeddingsModule(IEmbeddingEngine):
         except Exception as e:
             return ProcessingResult(success=False, data=[], error=str(e))
     
+    def hybrid_search_batch(self, queries: List[str], dialogue_id: str,
+                            keywords: List[List[str]] = None) -> ProcessingResult:
+        """Гибридный поиск для пачки запросов: одно кодирование, один проход по индексу"""
+        self._lazy_init()
+        
+        try:
+            if not queries:
+                return ProcessingResult(success=True, data=[], metadata={'queries': []})
+            
+            if keywords is None:
+                keywords = [None] * len(queries)
+            keywords = [
+                kws if kws else self._extract_keywords(query)
+                for query, kws in zip(queries, keywords)
+            ]
+            
+            # Все запросы кодируем одним батчем, мимо кэша движка
+            query_vectors = self.engine.encode_batch(queries, use_cache=False)
+            batch_results = self.vector_store.search_batch(
+                dialogue_id=dialogue_id,
+                query_vectors=query_vectors,
+                top_k=15,
+                query_is_normalized=True
+            )
+            
+            final_results = [
+                self._rank_results(dialogue_id, results, kws)
+                for results, kws in zip(batch_results, keywords)
+            ]
+            
+            self.stats['searches'] += len(queries)
+            
+            return ProcessingResult(
+                success=True,
+                data=final_results,
+                metadata={'queries': queries, 'keywords': keywords}
+            )
+            
+        except Exception as e:
+            return ProcessingResult(success=False, data=[], error=str(e))
+    
+    def _rank_results(self, dialogue_id: str, results: List[Dict],
+                      keywords: List[str]) -> List[Dict]:
+        """Переранжирование результатов с учётом ключевых слов и приоритета"""
+        # Приоритеты читаем из столбца priority по индексу результата
+        metadata = self.vector_store.get_metadata(dialogue_id)
+        priorities = metadata.priority if metadata is not None else None
+        text_lowers = self._get_text_lower(dialogue_id)
+        
+        # Ключевые слова приводим к нижнему регистру один раз на запрос,
+        # а не для каждого результата
+        kws_lower = [kw.lower() for kw in keywords]
+        
+        # Ранжирование с учётом ключевых слов
+        for result in results:
+            score = result['score']
+            if text_lowers is not None:
+                text_lower = text_lowers[result['index']]
+            else:
+                text_lower = result['text'].lower()
+            
+            # Буст за каждое найденное ключевое слово. Проверяем вхождение
+            # каждого слова отдельно: вложенные слова ("работа"/"работаю")
+            # должны засчитываться оба
+            hits = sum(kw in text_lower for kw in kws_lower)
+            if hits:
+                score *= 1.2 ** hits
+            
+            # Буст за приоритет
+            if priorities is not None and priorities[result['index']] > 0.5:
+                score *= 1.1
+            
+            result['final_score'] = score
+        
+        # Сортировка и топ-5
+        results.sort(key=lambda x: x['final_score'], reverse=True)
+        return results[:5]
+    
+    def _get_text_lower(self, dialogue_id: str) -> Optional[List[str]]:
+        """Тексты диалога в нижнем регистре, сверенные с текущим содержимым хранилища"""
+        store_texts = self.vector_store.texts.get(dialogue_id)
+        if store_texts is None:
+            self._text_lower.pop(dialogue_id, None)
+            return None
+        
+        cached = self._text_lower.get(dialogue_id)
+        if cached is None or cached[0] is not store_texts or len(cached[1]) != len(store_texts):
+            cached = (store_texts, [text.lower() for text in store_texts])
+            self._text_lower[dialogue_id] = cached
+        return cached[1]
+    
     def _extract_keywords(self, query: str) -> List[str]:
         """Извлечение ключевых слов"""
         stop_words = {'как', 'что', 'где', 'когда', 'почему', 'у', 'в', 'на', 'с'}
         words = re.findall(r'\b\w+\b', query.lower())
         return [w for w in words if w not in stop_words and len(w) > 2]
     
+    def clear_dialogue(self, dialogue_id: str):
+        """Очищает индекс диалога вместе с кэшем текстов в нижнем регистре"""
+        self._text_lower.pop(dialogue_id, None)
+        if self.vector_store is not None and dialogue_id in self.vector_store.texts:
+            self.vector_store.clear_dialogue(dialogue_id)
+    
+    def load_dialogue(self, dialogue_id: str, filepath: str, mmap: bool = False) -> bool:
+        """Загружает индекс диалога с диска и пересобирает кэш нижнего регистра"""
+        self._lazy_init()
+        self._text_lower.pop(dialogue_id, None)
+        if not self.vector_store.load(dialogue_id, filepath, mmap=mmap):
+            return False
+        self._get_text_lower(dialogue_id)
+        return True
+    
     # Совместимость с интерфейсом
     def encode_texts(self, texts: List[str]) -> ProcessingResult:
         self._lazy_init()
@@ -6,6 +6,7 @@ from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from enum import Enum
+import numpy as np
 
 
 class SimilarityMetric(Enum):
@@ -26,11 +27,11 @@ class PoolingStrategy(Enum):
     WEIGHTED_MEAN = "weighted_mean"
 
 
-@dataclass
+@dataclass(slots=True)
 class VectorDocument:
     """Документ с векторным представлением"""
     id: str
-    vector: Any  # numpy array или list
+    vector: np.ndarray
     metadata: Dict[str, Any] = field(default_factory=dict)
     text: Optional[str] = None
     timestamp: datetime = field(default_factory=datetime.now)
@@ -49,6 +50,48 @@ class VectorDocument:
 
 
 @dataclass
+class MetadataSoA:
+    """Метаданные чанков в виде параллельных массивов (SoA) вместо списка словарей"""
+    session_ids: List[str] = field(default_factory=list)
+    msg_idx: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int32))
+    chunk_idx: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int32))
+    # float64: row() возвращает тот же float, что был передан при индексации
+    priority: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.float64))
+    
+    def __len__(self) -> int:
+        return len(self.session_ids)
+    
+    @classmethod
+    def from_dicts(cls, metadata: List[Dict[str, Any]]) -> 'MetadataSoA':
+        """Собирает SoA из списка словарей (старый формат)"""
+        return cls(
+            session_ids=[m.get('session_id', '') for m in metadata],
+            msg_idx=np.fromiter((m.get('msg_idx', 0) for m in metadata),
+                                dtype=np.int32, count=len(metadata)),
+            chunk_idx=np.fromiter((m.get('chunk_idx', 0) for m in metadata),
+                                  dtype=np.int32, count=len(metadata)),
+            priority=np.fromiter((m.get('priority', 0.0) for m in metadata),
+                                 dtype=np.float64, count=len(metadata))
+        )
+    
+    def extend(self, other: 'MetadataSoA'):
+        """Дописывает столбцы другого батча"""
+        self.session_ids.extend(other.session_ids)
+        self.msg_idx = np.concatenate([self.msg_idx, other.msg_idx])
+        self.chunk_idx = np.concatenate([self.chunk_idx, other.chunk_idx])
+        self.priority = np.concatenate([self.priority, other.priority])
+    
+    def row(self, idx: int) -> Dict[str, Any]:
+        """Материализует словарь метаданных для одной строки"""
+        return {
+            'session_id': self.session_ids[idx],
+            'msg_idx': int(self.msg_idx[idx]),
+            'chunk_idx': int(self.chunk_idx[idx]),
+            'priority': float(self.priority[idx])
+        }
+
+
+@dataclass(slots=True)
 class SearchResult:
     """Результат векторного поиска"""
     doc_id: str
@@ -169,7 +212,7 @@ class EmbeddingStats:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class PerformanceMetrics:
     """Метрики производительности"""
     operation: str
@@ -5,21 +5,35 @@
 import torch
 import numpy as np
 from typing import List, Dict, Optional, Union, Tuple, Any, Callable
-from transformers import AutoTokenizer, AutoModel
+from transformers import AutoTokenizer, AutoModel, PreTrainedTokenizerFast
 import hashlib
+import re
 import logging
 from dataclasses import dataclass, field
 from pathlib import Path
 import pickle
 import json
-from collections import defaultdict, deque
+from collections import defaultdict, deque, OrderedDict
 from datetime import datetime
 import warnings
 from enum import Enum
 from abc import ABC, abstractmethod
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
+import tempfile
+
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    ORT_AVAILABLE = True
+except ImportError:
+    ORT_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
@@ -55,14 +69,16 @@ class EmbeddingConfig:
     pooling_strategy: PoolingStrategy = PoolingStrategy.MEAN
     cache_dir: Optional[str] = None
     use_cache: bool = True
+    cache_capacity: int = 50000  # Максимум эмбеддингов в LRU-кэше
     
     # Новые параметры
     use_amp: bool = True  # Automatic Mixed Precision для ускорения
-    num_workers: int = 4  # Для параллельной обработки
+    num_workers: int = 4  # Не используется: одну модель потоки не распараллеливают
     prefetch_batches: int = 2  # Предзагрузка батчей
     warmup_steps: int = 0  # Прогрев модели
     compile_model: bool = False  # torch.compile для ускорения (PyTorch 2.0+)
     quantize_model: bool = False  # Квантизация для уменьшения памяти
+    use_onnx: bool = False  # ONNX Runtime вместо PyTorch на CPU (нужен optimum)
     
     def __post_init__(self):
         """Валидация и коррекция параметров"""
@@ -74,6 +90,20 @@ class EmbeddingConfig:
         if self.compile_model and not hasattr(torch, 'compile'):
             logger.warning("torch.compile недоступен, отключаем компиляцию")
             self.compile_model = False
+        
+        if self.use_onnx and (self.device != "cpu" or not ORT_AVAILABLE):
+            logger.warning("ONNX Runtime доступен только на CPU с установленным optimum, используем PyTorch")
+            self.use_onnx = False
+        
+        if self.use_onnx:
+            # Экспортированный граф не компилируется и не работает в fp16
+            self.compile_model = False
+            self.use_amp = False
+        
+        if self.quantize_model and self.device == "cpu" and not self.use_onnx:
+            # Динамическая int8-квантизация применяется к fp32 весам -
+            # модель нельзя грузить в пониженной точности
+            self.use_amp = False
 
 
 # ============== Улучшенный EmbeddingEngine ==============
@@ -81,13 +111,32 @@ class EmbeddingConfig:
 class ImprovedEmbeddingEngine:
     """Улучшенный движок для создания эмбеддингов с оптимизациями"""
     
+    # Фиксированные длины последовательностей для скомпилированной модели:
+    # CUDA Graphs переигрываются только на статических формах
+    SEQ_LEN_BUCKETS = (64, 128, 256, 512)
+    
+    _WS_RE = re.compile(r'\s+')
+    
     def __init__(self, config: Optional[EmbeddingConfig] = None):
         self.config = config or EmbeddingConfig()
         
-        # Thread-safe кэш
-        self.cache = {} if self.config.use_cache else None
+        # Thread-safe LRU-кэш: хэш -> строка арены, сами векторы лежат
+        # в непрерывном массиве (capacity, dim), выделяемом при первой записи
+        self.cache = OrderedDict() if self.config.use_cache else None
+        self._arena = None
+        # Буферы входов скомпилированной модели: (rows, seq_len) -> тензоры на устройстве
+        self._tok_bufs: Dict[Tuple[int, int], Dict[str, torch.Tensor]] = {}
         self.cache_lock = threading.Lock()
         
+        # Параметры модели входят в ключ кэша как seed/ключ хэша -
+        # префикс считается один раз, а не склеивается с каждым текстом
+        config_str = (f"{self.config.model_name}_{self.config.pooling_strategy.value}_"
+                      f"{self.config.max_length}").encode()
+        if XXHASH_AVAILABLE:
+            self._hash_seed = xxhash.xxh3_64_intdigest(config_str)
+        else:
+            self._hash_key = hashlib.blake2b(config_str, digest_size=32).digest()
+        
         # Статистика
         self.stats = {
             'total_encoded': 0,
@@ -100,14 +149,8 @@ class ImprovedEmbeddingEngine:
         # Загрузка модели с обработкой ошибок
         self._load_model()
         
-        # AMP scaler для mixed precision
-        self.scaler = torch.cuda.amp.GradScaler() if self.config.use_amp else None
-        
-        # Thread pool для параллельной обработки
-        self.executor = ThreadPoolExecutor(max_workers=self.config.num_workers)
-        
-        # Прогрев модели
-        if self.config.warmup_steps > 0:
+        # Прогрев модели (для скомпилированной - обязательно, по всем формам)
+        if self.config.warmup_steps > 0 or self.config.compile_model:
             self._warmup_model()
     
     def _load_model(self):
@@ -115,18 +158,43 @@ class ImprovedEmbeddingEngine:
         try:
             logger.info(f"Загружаем модель {self.config.model_name}")
             
+            # bf16 на Ampere+ не переполняется и не требует масштабирования,
+            # на старых GPU остаёмся на fp16
+            if torch.cuda.is_available() and torch.cuda.is_bf16_supported():
+                self.amp_dtype = torch.bfloat16
+            else:
+                self.amp_dtype = torch.float16
+            
             # Загрузка с кэшированием
             cache_dir = Path(self.config.cache_dir) if self.config.cache_dir else None
             self.tokenizer = AutoTokenizer.from_pretrained(
                 self.config.model_name,
-                cache_dir=cache_dir
+                cache_dir=cache_dir,
+                use_fast=True
             )
+            if not isinstance(self.tokenizer, PreTrainedTokenizerFast):
+                logger.warning("Для модели нет быстрого (Rust) токенизатора, используем медленный")
+            
+            self.device = torch.device(self.config.device)
+            
+            # Позиционные веса для WEIGHTED_MEAN не зависят от батча.
+            # Делим на max_length: сумма весов не переполняет fp16, а отношение
+            # взвешенной суммы к сумме весов не меняется
+            self._pos_weights = (torch.arange(
+                self.config.max_length, 0, -1, dtype=torch.float32, device=self.device
+            ) / self.config.max_length).unsqueeze(0).unsqueeze(-1)
+            self._pool_fn = self._select_pooling()
+            
+            if self.config.use_onnx:
+                self._load_onnx_model(cache_dir)
+                logger.info("Модель загружена в ONNX Runtime")
+                return
             
             # Загружаем модель
             self.model = AutoModel.from_pretrained(
                 self.config.model_name,
                 cache_dir=cache_dir,
-                torch_dtype=torch.float16 if self.config.use_amp else torch.float32
+                torch_dtype=self.amp_dtype if self.config.use_amp else torch.float32
             )
             
             # Квантизация если нужна
@@ -134,11 +202,14 @@ class ImprovedEmbeddingEngine:
                 self._quantize_model()
             
             # Компиляция для ускорения (PyTorch 2.0+)
+            # reduce-overhead включает захват CUDA Graphs - почти нулевой
+            # overhead запуска на повторяющихся формах батча
             if self.config.compile_model:
-                self.model = torch.compile(self.model)
+                self.model = torch.compile(
+                    self.model, mode="reduce-overhead", fullgraph=False, dynamic=False
+                )
             
             # Переносим на устройство
-            self.device = torch.device(self.config.device)
             self.model = self.model.to(self.device)
             self.model.eval()
             
@@ -152,26 +223,159 @@ class ImprovedEmbeddingEngine:
             logger.error(f"Ошибка загрузки модели: {e}")
             raise RuntimeError(f"Не удалось загрузить модель {self.config.model_name}: {e}")
     
-    def _quantize_model(self):
-        """Квантизация модели для уменьшения памяти"""
-        if hasattr(torch, 'quantization'):
-            logger.info("Применяем квантизацию модели")
-            self.model = torch.quantization.quantize_dynamic(
-                self.model,
-                {torch.nn.Linear},
-                dtype=torch.qint8
+    def _load_onnx_model(self, cache_dir: Optional[Path]):
+        """
+        Экспорт модели в ONNX и запуск через ONNX Runtime.
+        При quantize_model на CPU с VNNI - динамическая int8-квантизация графа
+        """
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            self.config.model_name,
+            export=True,
+            cache_dir=cache_dir
+        )
+        
+        if self.config.quantize_model:
+            if not self._cpu_has_int8_dot():
+                logger.warning("CPU без avx512_vnni/avx_vnni/amx_int8, квантизация ONNX пропущена")
+                return
+            
+            # Квантованный граф кладём в постоянный каталог рядом с кэшем модели
+            # (отдельно под каждую ISA) и переиспользуем при следующих запусках
+            isa = self._onnx_quantization_isa()
+            model_slug = re.sub(r'[^\w.-]', '_', self.config.model_name)
+            save_dir = ((cache_dir or Path(tempfile.gettempdir()))
+                        / "onnx_int8" / f"{model_slug}_{isa}")
+            if not (save_dir / "model_quantized.onnx").exists():
+                quantizer = ORTQuantizer.from_pretrained(self.model)
+                qconfig = getattr(AutoQuantizationConfig, isa)(is_static=False, per_channel=False)
+                quantizer.quantize(save_dir=save_dir, quantization_config=qconfig)
+            self.model = ORTModelForFeatureExtraction.from_pretrained(
+                save_dir, file_name="model_quantized.onnx"
             )
     
+    def _quantize_model(self):
+        """Квантизация модели для уменьшения памяти (int8 только на CPU с VNNI/AMX)"""
+        if self.config.device != "cpu":
+            logger.warning("Динамическая int8-квантизация поддерживается только на CPU, пропускаем")
+            return
+        if self.config.use_amp:
+            logger.warning("Модель загружена в пониженной точности, int8-квантизация пропущена")
+            return
+        if not self._cpu_has_int8_dot():
+            # Без VNNI/AMX int8-ядра медленнее fp32 - квантизация только навредит
+            logger.warning("CPU без avx512_vnni/avx_vnni/amx_int8, квантизация пропущена")
+            return
+        
+        logger.info("Применяем квантизацию модели")
+        self.model = torch.ao.quantization.quantize_dynamic(
+            self.model,
+            {torch.nn.Linear},
+            dtype=torch.qint8
+        )
+    
+    @staticmethod
+    def _cpu_flags() -> set:
+        """Флаги процессора из /proc/cpuinfo (пустое множество, если недоступно)"""
+        try:
+            with open('/proc/cpuinfo') as f:
+                for line in f:
+                    if line.startswith('flags'):
+                        return set(line.split(':', 1)[1].split())
+        except OSError:
+            pass
+        return set()
+    
+    @classmethod
+    def _cpu_has_int8_dot(cls) -> bool:
+        """Проверяет наличие int8 dot-product инструкций"""
+        return bool(cls._cpu_flags() & {'avx512_vnni', 'avx_vnni', 'amx_int8'})
+    
+    @classmethod
+    def _onnx_quantization_isa(cls) -> str:
+        """
+        Имя конструктора AutoQuantizationConfig под набор инструкций CPU:
+        avx512_vnni (есть и на процессорах с AMX), avx512, иначе avx2
+        (avx_vnni без AVX-512 использует 256-битные ядра)
+        """
+        flags = cls._cpu_flags()
+        if flags & {'avx512_vnni', 'amx_int8'}:
+            return 'avx512_vnni'
+        if 'avx512f' in flags:
+            return 'avx512'
+        return 'avx2'
+    
     def _warmup_model(self):
         """Прогрев модели для стабильной производительности"""
-        logger.info(f"Прогрев модели: {self.config.warmup_steps} шагов")
-        dummy_texts = ["Прогрев модели"] * min(self.config.batch_size, 8)
-        
-        for _ in range(self.config.warmup_steps):
-            self._encode_batch(dummy_texts)
+        steps = max(1, self.config.warmup_steps)
+        logger.info(f"Прогрев модели: {steps} шагов")
+        
+        if self.config.compile_model:
+            # Компилируем и записываем графы для каждой формы заранее
+            pad_id = self.tokenizer.pad_token_id or 0
+            for seq_len in self._seq_len_buckets():
+                dummy = {
+                    'input_ids': torch.full(
+                        (self.config.batch_size, seq_len), pad_id, dtype=torch.long
+                    ),
+                    'attention_mask': torch.ones(
+                        (self.config.batch_size, seq_len), dtype=torch.long
+                    )
+                }
+                if 'token_type_ids' in self.tokenizer.model_input_names:
+                    dummy['token_type_ids'] = torch.zeros(
+                        (self.config.batch_size, seq_len), dtype=torch.long
+                    )
+                dummy = self._static_batch(dummy, self.config.batch_size, seq_len)
+                for _ in range(steps):
+                    self._forward(dummy)
+        else:
+            dummy_texts = ["Прогрев модели"] * min(self.config.batch_size, 8)
+            for _ in range(steps):
+                self._encode_batch(dummy_texts)
         
         self.stats['total_encoded'] = 0  # Сбрасываем после прогрева
     
+    def _seq_len_buckets(self) -> List[int]:
+        """Допустимые длины последовательностей для скомпилированной модели"""
+        buckets = [b for b in self.SEQ_LEN_BUCKETS if b < self.config.max_length]
+        return buckets + [self.config.max_length]
+    
+    def _bucket_seq_len(self, seq_len: int) -> int:
+        """Округляет длину вверх до ближайшей фиксированной формы"""
+        for bucket in self._seq_len_buckets():
+            if seq_len <= bucket:
+                return bucket
+        return self.config.max_length
+    
+    def _static_batch(self, batch: Dict[str, torch.Tensor],
+                      rows: int, seq_len: int) -> Dict[str, torch.Tensor]:
+        """
+        Копирует батч в постоянные буферы устройства формы (rows x seq_len),
+        дополняя паддингом - без новых аллокаций на каждый батч
+        """
+        bufs = self._tok_bufs.setdefault((rows, seq_len), {})
+        pad_id = self.tokenizer.pad_token_id or 0
+        non_blocking = self.device.type == 'cuda'
+        static = {}
+        for key, tensor in batch.items():
+            buf = bufs.get(key)
+            if buf is None:
+                buf = bufs[key] = torch.empty((rows, seq_len), dtype=tensor.dtype, device=self.device)
+            buf.fill_(pad_id if key == 'input_ids' else 0)
+            if non_blocking:
+                tensor = tensor.pin_memory()
+            buf[:tensor.size(0), :tensor.size(1)].copy_(tensor, non_blocking=non_blocking)
+            static[key] = buf
+        return static
+    
+    @property
+    def embedding_dim(self) -> int:
+        """Размерность эмбеддинга с учётом стратегии пулинга"""
+        dim = self.model.config.hidden_size
+        if self.config.pooling_strategy == PoolingStrategy.MEAN_MAX:
+            dim *= 2
+        return dim
+    
     def encode(self, texts: Union[str, List[str]], 
                show_progress: bool = False,
                return_tensors: bool = False) -> Union[np.ndarray, torch.Tensor]:
@@ -219,208 +423,326 @@ class ImprovedEmbeddingEngine:
         
         return embeddings
     
+    def encode_to_memmap(self, texts: List[str], out_path: Union[str, Path],
+                         show_progress: bool = False) -> Optional[np.memmap]:
+        """
+        Кодирование для офлайн-индексации прямо в файл (fp16, np.memmap).
+        Кэш не используется, в памяти держится только текущий блок батчей
+        
+        Args:
+            texts: Список текстов
+            out_path: Путь к выходному файлу
+            show_progress: Показывать прогресс
+        
+        Returns:
+            np.memmap формы (len(texts), dim) или None для пустого списка
+        """
+        start_time = time.time()
+        texts = self._validate_texts(texts)
+        
+        # Блок из нескольких батчей - сортировка по длине внутри блока ещё работает
+        block = self.config.batch_size * max(1, self.config.prefetch_batches)
+        mm = None
+        
+        for start in range(0, len(texts), block):
+            embeddings = self._encode_batch_parallel(texts[start:start + block], False)
+            if mm is None:
+                mm = np.memmap(out_path, dtype=np.float16, mode='w+',
+                               shape=(len(texts), embeddings.shape[1]))
+            mm[start:start + len(embeddings)] = embeddings
+            
+            if show_progress:
+                logger.info(f"Записано {min(start + block, len(texts))}/{len(texts)} эмбеддингов")
+        
+        if mm is not None:
+            mm.flush()
+        
+        encoding_time = time.time() - start_time
+        self.stats['encoding_time'] += encoding_time
+        self.stats['last_batch_time'] = encoding_time
+        self.stats['total_encoded'] += len(texts)
+        
+        return mm
+    
     def _validate_texts(self, texts: List[str]) -> List[str]:
         """Валидация и очистка текстов"""
+        max_chars = self.config.max_length * 6  # Примерная оценка
+        ws_sub = self._WS_RE.sub
         validated = []
         for text in texts:
             if not isinstance(text, str):
                 text = str(text)
             
-            # Убираем лишние пробелы
-            text = ' '.join(text.split())
-            
-            # Ограничиваем длину если слишком длинный
-            if len(text) > self.config.max_length * 6:  # Примерная оценка
-                text = text[:self.config.max_length * 6]
-            
-            validated.append(text)
+            # Схлопываем пробелы и обрезаем одним срезом
+            validated.append(ws_sub(' ', text.strip())[:max_chars])
         
         return validated
     
     def _encode_with_cache(self, texts: List[str], show_progress: bool) -> np.ndarray:
-        """Кодирование с использованием кэша"""
-        embeddings = []
-        uncached_texts = []
-        uncached_indices = []
-        
-        if self.config.use_cache:
-            with self.cache_lock:
-                for i, text in enumerate(texts):
-                    text_hash = self._get_text_hash(text)
-                    if text_hash in self.cache:
-                        embeddings.append(self.cache[text_hash])
-                        self.stats['cache_hits'] += 1
-                    else:
-                        uncached_texts.append(text)
-                        uncached_indices.append(i)
-                        self.stats['cache_misses'] += 1
-        else:
-            uncached_texts = texts
-            uncached_indices = list(range(len(texts)))
-        
-        # Кодируем некэшированные
-        if uncached_texts:
-            new_embeddings = self._encode_batch_parallel(uncached_texts, show_progress)
+        """
+        Кодирование с использованием кэша и дедупликацией внутри запроса.
+        Строки арены ищутся по словарю поштучно (dict.get на каждый хэш), а все
+        попадания копируются из арены одной индексацией numpy
+        """
+        if not texts:
+            return np.empty((0, self.embedding_dim), dtype=np.float32)
+        
+        if not self.config.use_cache:
+            return self._encode_batch_parallel(texts, show_progress)
+        
+        # Хэши считаем один раз - и для поиска, и для записи в кэш
+        hashes = [self._get_text_hash(text) for text in texts]
+        miss_slots = {}  # хэш -> позиция среди уникальных некэшированных текстов
+        miss_texts, miss_pos, miss_idx = [], [], []
+        result = None
+        
+        # Под блокировкой только поиск строк и копирование из арены: без неё
+        # параллельная вставка может переписать строку между get и чтением
+        with self.cache_lock:
+            # Номера строк арены: dict.get на каждый хэш, собранные в int64-массив
+            # (-1 - промах), чтобы дальше работать масками
+            cache_get = self.cache.get
+            rows = np.fromiter((cache_get(h, -1) for h in hashes),
+                               dtype=np.int64, count=len(hashes))
+            hit_mask = rows >= 0
+            n_hits = int(np.count_nonzero(hit_mask))
             
-            # Добавляем в кэш
-            if self.config.use_cache:
-                with self.cache_lock:
-                    for text, embedding in zip(uncached_texts, new_embeddings):
-                        text_hash = self._get_text_hash(text)
-                        self.cache[text_hash] = embedding
+            # Попадания копируем из арены сразу, пока строки не вытеснены
+            # (присваивание в fp32-результат заодно повышает точность)
+            if n_hits:
+                result = np.empty((len(texts), self._arena.shape[1]), dtype=np.float32)
+                result[hit_mask] = self._arena[rows[hit_mask]]
+                touch = self.cache.move_to_end
+                for i in np.flatnonzero(hit_mask):
+                    touch(hashes[i])
             
-            # Объединяем результаты
-            if embeddings:
-                result = np.zeros((len(texts), new_embeddings.shape[1]))
-                cached_idx = 0
-                new_idx = 0
-                
-                for i in range(len(texts)):
-                    if i in uncached_indices:
-                        result[i] = new_embeddings[new_idx]
-                        new_idx += 1
-                    else:
-                        result[i] = embeddings[cached_idx]
-                        cached_idx += 1
-                
-                embeddings = result
-            else:
-                embeddings = new_embeddings
+            self.stats['cache_hits'] += n_hits
+            self.stats['cache_misses'] += len(hashes) - n_hits
+        
+        # Дедупликация промахов - локальная работа, блокировка не нужна
+        for i in np.flatnonzero(~hit_mask) if n_hits else range(len(hashes)):
+            text_hash = hashes[i]
+            slot = miss_slots.get(text_hash)
+            if slot is None:
+                slot = miss_slots[text_hash] = len(miss_texts)
+                miss_texts.append(texts[i])
+            miss_pos.append(i)
+            miss_idx.append(slot)
+        
+        if not miss_texts:
+            return result
+        
+        # Модель прогоняем только по уникальным некэшированным текстам
+        new_embeddings = self._encode_batch_parallel(miss_texts, show_progress)
+        
+        with self.cache_lock:
+            for text_hash, embedding in zip(miss_slots, new_embeddings):
+                self._cache_put(text_hash, embedding)
+        
+        if len(miss_texts) == len(texts):
+            return new_embeddings
+        
+        # Раскладываем строки по исходным позициям
+        if result is None:
+            result = np.empty((len(texts), new_embeddings.shape[1]), dtype=np.float32)
+        result[miss_pos] = new_embeddings[miss_idx]
+        
+        return result
+    
+    def _cache_put(self, text_hash: int, embedding: np.ndarray):
+        """Записывает эмбеддинг в арену, вытесняя самую старую запись (под cache_lock)"""
+        if self._arena is None:
+            # fp16 вдвое компактнее: для нормированных векторов косинус
+            # смещается не больше чем на ~1e-3
+            self._arena = np.empty(
+                (self.config.cache_capacity, embedding.shape[0]), dtype=np.float16
+            )
+        
+        row = self.cache.get(text_hash)
+        if row is not None:
+            self.cache.move_to_end(text_hash)
+        elif len(self.cache) < self.config.cache_capacity:
+            row = len(self.cache)
         else:
-            embeddings = np.array(embeddings)
+            _, row = self.cache.popitem(last=False)
         
-        return embeddings
+        self._arena[row] = embedding
+        self.cache[text_hash] = row
     
     def _encode_batch_parallel(self, texts: List[str], show_progress: bool) -> np.ndarray:
-        """Параллельное кодирование батчей"""
-        if len(texts) <= self.config.batch_size:
-            # Один батч - не нужна параллелизация
-            return self._encode_batch(texts, show_progress)
-        
-        # Разбиваем на батчи
-        batches = []
-        for i in range(0, len(texts), self.config.batch_size):
-            batch = texts[i:i + self.config.batch_size]
-            batches.append(batch)
-        
-        # Параллельная обработка
-        futures = []
-        for batch in batches:
-            future = self.executor.submit(self._encode_batch, batch, False)
-            futures.append(future)
-        
-        # Собираем результаты
-        all_embeddings = []
-        for i, future in enumerate(as_completed(futures)):
+        """
+        Кодирование одним потоком на устройстве: единая токенизация,
+        сортировка по длине и проход по уже токенизированным тензорам.
+        Пул потоков здесь не даёт параллелизма - все задачи упираются в одну модель;
+        склейку мелких запросов в большие батчи делает EmbeddingBatchProcessor
+        """
+        encoded = self.tokenizer(
+            texts,
+            padding='longest',
+            truncation=True,
+            max_length=self.config.max_length,
+            return_tensors="pt"
+        )
+        
+        # Сортируем по числу токенов - в батче почти нет паддинга
+        lengths = encoded['attention_mask'].sum(dim=1)
+        order = torch.argsort(lengths, stable=True)
+        trim_padding = self.tokenizer.padding_side == 'right'
+        
+        n = len(texts)
+        batch_size = self.config.batch_size
+        n_batches = (n + batch_size - 1) // batch_size
+        sorted_embeddings = None
+        
+        for batch_num, start in enumerate(range(0, n, batch_size)):
+            batch_idx = order[start:start + batch_size]
+            seq_len = int(lengths[batch_idx].max()) if trim_padding else encoded['input_ids'].size(1)
+            batch = {k: v[batch_idx, :seq_len] for k, v in encoded.items()}
+            
+            if self.config.compile_model:
+                # Статическая форма для переигрывания CUDA Graph
+                batch = self._static_batch(batch, batch_size, self._bucket_seq_len(seq_len))
+            else:
+                batch = self._to_device(batch)
+            
+            embeddings = self._forward(batch)[:len(batch_idx)]
+            
+            if sorted_embeddings is None:
+                sorted_embeddings = torch.empty(
+                    (n, embeddings.size(1)), dtype=embeddings.dtype, device=embeddings.device
+                )
+            sorted_embeddings[start:start + len(batch_idx)] = embeddings
+            
             if show_progress:
-                logger.info(f"Обработан батч {i+1}/{len(batches)}")
-            embeddings = future.result()
-            all_embeddings.append(embeddings)
+                logger.info(f"Обработан батч {batch_num + 1}/{n_batches}")
         
-        # Восстанавливаем порядок
-        return np.vstack(all_embeddings)
+        # Восстанавливаем исходный порядок
+        result = torch.empty_like(sorted_embeddings)
+        result[order.to(result.device)] = sorted_embeddings
+        
+        return self._to_numpy(result)
     
     def _encode_batch(self, texts: List[str], show_progress: bool = False) -> np.ndarray:
         """Оптимизированное кодирование батча"""
         # Токенизация
         encoded = self.tokenizer(
             texts,
-            padding=True,
+            padding='longest',
             truncation=True,
             max_length=self.config.max_length,
             return_tensors="pt"
         )
         
-        # Переносим на устройство
-        encoded = {k: v.to(self.device) for k, v in encoded.items()}
-        
-        # Получаем эмбеддинги с AMP
+        return self._to_numpy(self._forward(self._to_device(encoded)))
+    
+    def _forward(self, encoded: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """
+        Прямой проход модели, пулинг и нормализация для токенизированного батча.
+        Всё выполняется под autocast, результат остаётся на устройстве
+        """
         with torch.no_grad():
             if self.config.use_amp and self.device.type == 'cuda':
-                with torch.cuda.amp.autocast():
-                    outputs = self.model(**encoded)
-            else:
-                outputs = self.model(**encoded)
-            
-            # Применяем стратегию пулинга
-            embeddings = self._apply_pooling(
-                outputs.last_hidden_state,
-                encoded['attention_mask']
-            )
-            
-            # Нормализация
-            if self.config.normalize:
-                embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
-            
-            # Конвертируем в numpy
-            embeddings = embeddings.cpu().numpy()
+                with torch.autocast(device_type="cuda", dtype=self.amp_dtype):
+                    return self._forward_pooled(encoded)
+            return self._forward_pooled(encoded)
+    
+    def _forward_pooled(self, encoded: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """Модель + пулинг + нормализация (вызывается из _forward)"""
+        outputs = self.model(**encoded)
+        
+        # Применяем стратегию пулинга
+        embeddings = self._pool_fn(
+            outputs.last_hidden_state,
+            encoded['attention_mask']
+        )
+        
+        # Нормализация
+        if self.config.normalize:
+            embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
         
         return embeddings
     
+    def _to_device(self, batch: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        """Перенос входов на устройство; на GPU - через pinned memory без блокировки"""
+        if self.device.type == 'cuda':
+            return {k: v.pin_memory().to(self.device, non_blocking=True) for k, v in batch.items()}
+        return {k: v.to(self.device) for k, v in batch.items()}
+    
+    def _to_numpy(self, embeddings: torch.Tensor) -> np.ndarray:
+        """
+        Одна копия на хост в конце батча.
+        С GPU - асинхронно в pinned memory, без блокирующих копий на каждый батч
+        """
+        embeddings = embeddings.float()
+        if embeddings.device.type == 'cuda':
+            host = torch.empty(embeddings.shape, dtype=embeddings.dtype, pin_memory=True)
+            host.copy_(embeddings, non_blocking=True)
+            torch.cuda.current_stream(embeddings.device).synchronize()
+            return host.numpy()
+        return embeddings.cpu().numpy()
+    
     def _apply_pooling(self, hidden_states: torch.Tensor, 
                        attention_mask: torch.Tensor) -> torch.Tensor:
-        """Расширенные стратегии пулинга"""
-        strategy = self.config.pooling_strategy
-        
-        if strategy == PoolingStrategy.CLS:
-            return hidden_states[:, 0, :]
-        
-        elif strategy == PoolingStrategy.MAX:
-            hidden_states = hidden_states.masked_fill(
-                ~attention_mask.unsqueeze(-1).bool(), -1e9
-            )
-            return torch.max(hidden_states, dim=1)[0]
-        
-        elif strategy == PoolingStrategy.MEAN:
-            attention_mask_expanded = attention_mask.unsqueeze(-1).expand(hidden_states.size()).float()
-            sum_embeddings = torch.sum(hidden_states * attention_mask_expanded, 1)
-            sum_mask = torch.clamp(attention_mask_expanded.sum(1), min=1e-9)
-            return sum_embeddings / sum_mask
-        
-        elif strategy == PoolingStrategy.MEAN_MAX:
-            # Комбинация mean и max pooling
-            mean_pool = self._apply_mean_pooling(hidden_states, attention_mask)
-            max_pool = self._apply_max_pooling(hidden_states, attention_mask)
-            return torch.cat([mean_pool, max_pool], dim=1)
-        
-        elif strategy == PoolingStrategy.WEIGHTED_MEAN:
-            # Взвешенное среднее с убыванием веса
-            seq_len = hidden_states.size(1)
-            weights = torch.arange(seq_len, 0, -1, dtype=torch.float32, device=hidden_states.device)
-            weights = weights.unsqueeze(0).unsqueeze(-1)
-            
-            weighted_hidden = hidden_states * weights
-            attention_mask_expanded = attention_mask.unsqueeze(-1).expand(hidden_states.size()).float()
-            
-            sum_embeddings = torch.sum(weighted_hidden * attention_mask_expanded, 1)
-            sum_weights = torch.sum(weights * attention_mask_expanded, 1)
-            sum_weights = torch.clamp(sum_weights, min=1e-9)
-            
-            return sum_embeddings / sum_weights
-        
-        else:
-            return self._apply_mean_pooling(hidden_states, attention_mask)
+        """Расширенные стратегии пулинга (функция выбрана один раз в _load_model)"""
+        return self._pool_fn(hidden_states, attention_mask)
+    
+    def _select_pooling(self) -> Callable[[torch.Tensor, torch.Tensor], torch.Tensor]:
+        """Привязывает конкретную функцию пулинга - без ветвления на каждом батче"""
+        return {
+            PoolingStrategy.CLS: self._apply_cls_pooling,
+            PoolingStrategy.MAX: self._apply_max_pooling,
+            PoolingStrategy.MEAN: self._apply_mean_pooling,
+            PoolingStrategy.MEAN_MAX: self._apply_mean_max_pooling,
+            PoolingStrategy.WEIGHTED_MEAN: self._apply_weighted_mean_pooling,
+        }.get(self.config.pooling_strategy, self._apply_mean_pooling)
+    
+    def _apply_cls_pooling(self, hidden_states, attention_mask):
+        """CLS pooling helper"""
+        return hidden_states[:, 0, :]
+    
+    def _apply_mean_max_pooling(self, hidden_states, attention_mask):
+        """Комбинация mean и max pooling"""
+        mean_pool = self._apply_mean_pooling(hidden_states, attention_mask)
+        max_pool = self._apply_max_pooling(hidden_states, attention_mask)
+        return torch.cat([mean_pool, max_pool], dim=1)
+    
+    def _apply_weighted_mean_pooling(self, hidden_states, attention_mask):
+        """Взвешенное среднее с убыванием веса"""
+        # Веса убывают от seq_len к 1: берём хвост заранее посчитанного тензора.
+        # Маска и веса в dtype скрытых состояний - без апкаста fp16/bf16 в fp32
+        seq_len = hidden_states.size(1)
+        weights = self._pos_weights[0, -seq_len:, 0].to(hidden_states.dtype)
+        weights = attention_mask.to(hidden_states.dtype) * weights
+        
+        sum_embeddings = torch.einsum('bl,blh->bh', weights, hidden_states)
+        sum_weights = weights.sum(1, keepdim=True).clamp(min=1e-4)
+        
+        return sum_embeddings / sum_weights
     
     def _apply_mean_pooling(self, hidden_states, attention_mask):
-        """Mean pooling helper"""
-        attention_mask_expanded = attention_mask.unsqueeze(-1).expand(hidden_states.size()).float()
-        sum_embeddings = torch.sum(hidden_states * attention_mask_expanded, 1)
-        sum_mask = torch.clamp(attention_mask_expanded.sum(1), min=1e-9)
-        return sum_embeddings / sum_mask
+        """Mean pooling helper: маскированная сумма одним bmm вместо expand/mul/sum"""
+        mask = attention_mask.to(hidden_states.dtype)
+        denom = mask.sum(1, keepdim=True).clamp(min=1)
+        return torch.einsum('bl,blh->bh', mask, hidden_states) / denom
     
     def _apply_max_pooling(self, hidden_states, attention_mask):
         """Max pooling helper"""
         hidden_states = hidden_states.masked_fill(
-            ~attention_mask.unsqueeze(-1).bool(), -1e9
+            ~attention_mask.unsqueeze(-1).bool(), torch.finfo(hidden_states.dtype).min
         )
         return torch.max(hidden_states, dim=1)[0]
     
-    def _get_text_hash(self, text: str) -> str:
-        """Улучшенное хэширование с учетом конфигурации"""
-        # Включаем параметры модели в хэш
-        config_str = f"{self.config.model_name}_{self.config.pooling_strategy.value}_{self.config.max_length}"
-        text_to_hash = f"{config_str}_{text}"
-        return hashlib.md5(text_to_hash.encode()).hexdigest()
+    def _get_text_hash(self, text: str) -> int:
+        """
+        64-битный хэш текста с учетом конфигурации модели (ключ LRU-кэша).
+        xxh3_64 с seed от конфигурации, если xxhash доступен, иначе keyed blake2b-64
+        """
+        data = text.encode('utf-8')
+        if XXHASH_AVAILABLE:
+            return xxhash.xxh3_64_intdigest(data, seed=self._hash_seed)
+        return int.from_bytes(
+            hashlib.blake2b(data, key=self._hash_key, digest_size=8).digest(), 'little'
+        )
     
     def get_stats(self) -> Dict[str, Any]:
         """Возвращает статистику использования"""
@@ -440,8 +762,3 @@ class ImprovedEmbeddingEngine:
                 self.stats['cache_hits'] = 0
                 self.stats['cache_misses'] = 0
             logger.info("Кэш очищен")
-    
-    def __del__(self):
-        """Корректное освобождение ресурсов"""
-        if hasattr(self, 'executor'):
-            self.executor.shutdown(wait=False)
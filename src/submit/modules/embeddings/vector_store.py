@@ -4,39 +4,108 @@
 """
 import numpy as np
 from typing import List, Dict, Optional, Any, Tuple
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import logging
+import os
 import pickle
+import sys
 import json
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
 from pathlib import Path
 
+from ._topk import top_k_desc
+
+try:
+    import simsimd
+    SIMSIMD_AVAILABLE = True
+except ImportError:
+    SIMSIMD_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
 
+def _aligned_empty(shape: Tuple[int, ...], dtype, alignment: int = 64) -> np.ndarray:
+    """
+    np.empty с началом данных, выровненным на alignment байт (64 - строка кэша и
+    ширина AVX-512): SIMD-ядра читают матрицу без невыровненной головы
+    """
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    raw = np.empty(nbytes + alignment, dtype=np.uint8)
+    offset = -raw.ctypes.data % alignment
+    return raw[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
 class VectorStore:
     """Базовое векторное хранилище с поддержкой различных метрик"""
     
-    def __init__(self, metric: str = "cosine", index_type: str = "flat"):
+    # Потолок потоков собственного пула search_many
+    MAX_SEARCH_WORKERS = 8
+    
+    def __init__(self, metric: str = "cosine", index_type: str = "flat",
+                 quantize: bool = False, query_cache_size: int = 0):
         """
         Инициализация векторного хранилища
         
         Args:
             metric: Метрика сходства (cosine, euclidean, dot)
             index_type: Тип индекса (flat, hnsw, annoy)
+            quantize: Искать по int8-копии единичных векторов (только cosine,
+                нужен simsimd) - вчетверо меньше трафика памяти при скане
+            query_cache_size: Сколько топ-k результатов одиночных запросов держать в LRU
+                (повторный запрос по неизменному диалогу не сканирует матрицу), 0 - без кэша.
+                Запись - k индексов и score, размер не зависит от числа векторов
         """
+        if quantize and (metric != "cosine" or not SIMSIMD_AVAILABLE):
+            logger.warning("int8 поиск доступен только для cosine с simsimd, используем fp32")
+            quantize = False
+        
         self.metric = metric
         self.index_type = index_type
+        self.quantize = quantize
+        # Ядро сходства выбирается один раз, а не ветвлением на каждый поиск
+        self._score = self._make_score_fn(metric, quantize)
         
         # Хранилища по диалогам
         self.dialogue_vectors = {}  # dialogue_id -> vectors array
         self.dialogue_texts = {}    # dialogue_id -> list of texts
-        self.dialogue_metadata = {}  # dialogue_id -> list of metadata
+        # Метаданные строк хранятся колонками: session_id - код int32 в словаре
+        # сессий диалога, а dict на строку - только если вызывающий передал доп. поля
+        self.dialogue_metadata = {}  # dialogue_id -> list of extra metadata (или None)
+        self.dialogue_session_ids = {}  # dialogue_id -> (N,) int32 коды сессий
+        self._session_id_buffers = {}   # dialogue_id -> (capacity,)
+        self.session_vocab = {}         # dialogue_id -> list of session_id
+        self._session_codes = {}        # dialogue_id -> session_id -> код
+        # Для cosine: векторы единичной длины, нормализуются один раз при добавлении
+        # (при quantize - сразу в int8 со шкалой 127)
+        self.dialogue_vectors_unit = {}  # dialogue_id -> unit vectors array
+        # Матрица, по которой считается сходство для выбранной метрики
+        self._scored_vectors = (self.dialogue_vectors_unit if metric == "cosine"
+                                else self.dialogue_vectors)
+        # Буферы с запасом ёмкости: dialogue_vectors(_unit) - view на заполненную часть
+        self._vector_buffers = {}  # dialogue_id -> (capacity x dim)
+        self._unit_buffers = {}    # dialogue_id -> (capacity x dim)
+        # Квадраты норм строк для numpy euclidean (||q-v||^2 через GEMM): считаются
+        # при добавлении, а не полным проходом по матрице на каждый поиск
+        self._track_sq_norms = metric == "euclidean" and not SIMSIMD_AVAILABLE
+        self.dialogue_sq_norms = {}  # dialogue_id -> (N,)
+        self._sq_norm_buffers = {}   # dialogue_id -> (capacity,)
+        # LRU топ-k одиночных запросов: (dialogue_id, байты запроса, k) ->
+        # (индексы, score) формы (1 x k), записи диалога сбрасываются при любом его изменении
+        self.query_cache_size = query_cache_size
+        self._score_cache = OrderedDict()
+        # Пул для search_many создаётся при первом вызове; блокировка защищает
+        # LRU и счётчики от параллельных поисков
+        self._executor = None
+        self._lock = threading.Lock()
         
         # Статистика
         self.stats = {
             'total_vectors': 0,
             'total_searches': 0,
-            'dialogues_count': 0
+            'dialogues_count': 0,
+            'score_cache_hits': 0
         }
         
         logger.info(f"VectorStore инициализирован: metric={metric}, index={index_type}")
@@ -57,29 +126,40 @@ class VectorStore:
         if len(vectors) != len(texts):
             raise ValueError("Количество векторов должно совпадать с количеством текстов")
         
+        # Непрерывный float32 - ядра поиска читают матрицу без копий на каждый запрос
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors):
+            self._invalidate_scores(dialogue_id)
+        
+        # Векторы дописываем в буферы с геометрическим ростом - амортизированно
+        # O(1) на вектор вместо vstack всей матрицы на каждом добавлении
+        self._append_rows(self.dialogue_vectors, self._vector_buffers, dialogue_id, vectors)
+        if self.metric == "cosine":
+            self._append_rows(self.dialogue_vectors_unit, self._unit_buffers,
+                              dialogue_id, self._scored_rows(vectors))
+        if self._track_sq_norms:
+            self._append_rows(self.dialogue_sq_norms, self._sq_norm_buffers, dialogue_id,
+                              np.einsum('ij,ij->i', vectors, vectors))
+        
         # Инициализируем хранилище для диалога если нужно
-        if dialogue_id not in self.dialogue_vectors:
-            self.dialogue_vectors[dialogue_id] = vectors
-            self.dialogue_texts[dialogue_id] = texts
-            self.dialogue_metadata[dialogue_id] = metadata or [{} for _ in texts]
+        if dialogue_id not in self.dialogue_texts:
+            self.dialogue_texts[dialogue_id] = []
+            self.dialogue_metadata[dialogue_id] = []
+            self.session_vocab[dialogue_id] = []
+            self._session_codes[dialogue_id] = {}
             self.stats['dialogues_count'] += 1
-        else:
-            # Добавляем к существующим
-            self.dialogue_vectors[dialogue_id] = np.vstack([
-                self.dialogue_vectors[dialogue_id],
-                vectors
-            ])
-            self.dialogue_texts[dialogue_id].extend(texts)
-            
-            if metadata:
-                self.dialogue_metadata[dialogue_id].extend(metadata)
-            else:
-                self.dialogue_metadata[dialogue_id].extend([{} for _ in texts])
         
-        # Добавляем session_id в метаданные
-        start_idx = len(self.dialogue_texts[dialogue_id]) - len(texts)
-        for i in range(len(texts)):
-            self.dialogue_metadata[dialogue_id][start_idx + i]['session_id'] = session_id
+        # Добавляем к существующим
+        self.dialogue_texts[dialogue_id].extend(texts)
+        self.dialogue_metadata[dialogue_id].extend(metadata or [None] * len(texts))
+        
+        # session_id один на весь вызов - пишем его код сразу для всех строк
+        if len(texts):
+            code = self._session_code(dialogue_id, session_id)
+            self._append_rows(self.dialogue_session_ids, self._session_id_buffers,
+                              dialogue_id, np.full(len(texts), code, dtype=np.int32))
+        elif dialogue_id not in self.dialogue_session_ids:
+            self.dialogue_session_ids[dialogue_id] = np.empty(0, dtype=np.int32)
         
         self.stats['total_vectors'] += len(vectors)
         
@@ -99,63 +179,285 @@ class VectorStore:
         Returns:
             Список результатов с текстами и scores
         """
-        self.stats['total_searches'] += 1
+        query_vectors = np.asarray(query_vector).reshape(1, -1)
+        return self.search_batch(dialogue_id, query_vectors, top_k, threshold)[0]
+    
+    def search_batch(self, dialogue_id: str, query_vectors: np.ndarray,
+                     top_k: int = 5, threshold: Optional[float] = None) -> List[List[Dict]]:
+        """
+        Поиск для нескольких запросов одним матричным умножением
+        
+        Args:
+            dialogue_id: ID диалога
+            query_vectors: Матрица запросов (Q x dim)
+            top_k: Количество результатов на запрос
+            threshold: Минимальный порог сходства
+            
+        Returns:
+            Списки результатов для каждого запроса
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        if query_vectors.ndim == 1:
+            query_vectors = query_vectors.reshape(1, -1)
+        n_queries = len(query_vectors)
+        
+        with self._lock:
+            self.stats['total_searches'] += n_queries
         
         # Проверяем наличие диалога
         if dialogue_id not in self.dialogue_vectors:
             logger.debug(f"Диалог {dialogue_id} не найден в хранилище")
-            return []
+            return [[] for _ in range(n_queries)]
         
         vectors = self.dialogue_vectors[dialogue_id]
         texts = self.dialogue_texts[dialogue_id]
         metadata = self.dialogue_metadata[dialogue_id]
+        session_ids = self.dialogue_session_ids[dialogue_id]
+        vocab = self.session_vocab[dialogue_id]
         
-        if len(vectors) == 0:
-            return []
+        k = min(top_k, len(vectors))
+        if k <= 0:
+            return [[] for _ in range(n_queries)]
         
-        # Вычисляем сходство
-        if self.metric == "cosine":
-            # Нормализуем векторы для косинусного сходства
-            query_norm = query_vector / (np.linalg.norm(query_vector) + 1e-8)
-            vectors_norm = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-8)
-            scores = np.dot(vectors_norm, query_norm)
-        elif self.metric == "euclidean":
-            # Евклидово расстояние (инвертированное)
-            distances = np.linalg.norm(vectors - query_vector, axis=1)
-            scores = 1.0 / (1.0 + distances)
-        elif self.metric == "dot":
-            # Скалярное произведение
-            scores = np.dot(vectors, query_vector)
-        else:
-            raise ValueError(f"Неизвестная метрика: {self.metric}")
+        # Топ-k по всем score, затем порог только по k кандидатам: порог монотонен
+        # по score, так что это тот же результат без масок и копий размера N
+        top_indices, top_scores = self._query_top_k(dialogue_id, query_vectors, k)
+        
+        batch_results = []
+        for row_indices, row_scores in zip(top_indices, top_scores):
+            # Применяем порог если задан
+            if threshold is not None:
+                keep = row_scores >= threshold
+                row_indices, row_scores = row_indices[keep], row_scores[keep]
+            
+            # Формируем результаты (Python-цикл только по k элементам)
+            row_sessions = [vocab[code] for code in session_ids[row_indices].tolist()]
+            batch_results.append([
+                {
+                    'text': texts[idx],
+                    'score': score,
+                    'session_id': sid,
+                    'metadata': self._row_metadata(metadata[idx], sid),
+                    'index': idx
+                }
+                for idx, score, sid in zip(row_indices.tolist(), row_scores.tolist(),
+                                           row_sessions)
+            ])
+        
+        return batch_results
+    
+    def search_many(self, dialogue_ids: List[str], query_vector: np.ndarray,
+                    top_k: int = 5, threshold: Optional[float] = None,
+                    executor: Optional[Executor] = None) -> Dict[str, List[Dict]]:
+        """
+        Поиск одного запроса сразу по нескольким диалогам в пуле потоков
+        
+        Ядра сходства (BLAS/SimSIMD) отпускают GIL, поэтому скан матриц разных
+        диалогов идёт параллельно; последовательным остаётся только сбор топ-k.
+        Не вызывать одновременно с add_vectors/clear_dialogue
+        
+        Args:
+            dialogue_ids: ID диалогов
+            query_vector: Вектор запроса
+            top_k: Количество результатов на диалог
+            threshold: Минимальный порог сходства
+            executor: Внешний пул вызывающего кода; без него используется
+                собственный пул хранилища (не больше MAX_SEARCH_WORKERS потоков)
+            
+        Returns:
+            Словарь dialogue_id -> список результатов
+        """
+        dialogue_ids = list(dict.fromkeys(dialogue_ids))
+        if len(dialogue_ids) <= 1:
+            return {dialogue_id: self.search(dialogue_id, query_vector, top_k, threshold)
+                    for dialogue_id in dialogue_ids}
         
-        # Применяем порог если задан
-        if threshold is not None:
-            valid_indices = np.where(scores >= threshold)[0]
+        if executor is None:
+            executor = self._get_executor()
+        
+        futures = {dialogue_id: executor.submit(self.search, dialogue_id,
+                                                query_vector, top_k, threshold)
+                   for dialogue_id in dialogue_ids}
+        return {dialogue_id: future.result() for dialogue_id, future in futures.items()}
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Собственный пул search_many, создаётся при первом обращении"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=min(self.MAX_SEARCH_WORKERS, os.cpu_count() or 1),
+                    thread_name_prefix="vector_store_search"
+                )
+            return self._executor
+    
+    def shutdown(self, wait: bool = True):
+        """Останавливает собственный пул потоков search_many"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+    
+    def __del__(self):
+        # Пул не должен переживать хранилище
+        executor = getattr(self, '_executor', None)
+        if executor is not None:
+            executor.shutdown(wait=False)
+    
+    def _query_top_k(self, dialogue_id: str, query_vectors: np.ndarray, k: int):
+        """
+        Топ-k запросов по диалогу (Q x k). Сходство считается сразу для всех
+        запросов (для cosine - по заранее нормализованной матрице); топ-k
+        одиночного запроса берётся из LRU, если уже считался
+        """
+        use_cache = len(query_vectors) == 1 and self.query_cache_size > 0
+        if use_cache:
+            key = (dialogue_id, query_vectors.tobytes(), k)
+            with self._lock:
+                cached = self._score_cache.get(key)
+                if cached is not None:
+                    self._score_cache.move_to_end(key)
+                    self.stats['score_cache_hits'] += 1
+                    return cached
+        
+        scores = self._score(self._scored_vectors[dialogue_id], query_vectors,
+                             self.dialogue_sq_norms.get(dialogue_id))
+        top = top_k_desc(scores, k)
+        
+        if use_cache:
+            # Закэшированные массивы разделяются между вызовами - запрещаем запись
+            for part in top:
+                part.flags.writeable = False
+            with self._lock:
+                self._score_cache[key] = top
+                if len(self._score_cache) > self.query_cache_size:
+                    self._score_cache.popitem(last=False)
+        return top
+    
+    def _invalidate_scores(self, dialogue_id: str):
+        """Сбрасывает закэшированные score диалога после изменения его векторов"""
+        with self._lock:
+            for key in [key for key in self._score_cache if key[0] == dialogue_id]:
+                del self._score_cache[key]
+    
+    def _session_code(self, dialogue_id: str, session_id: str) -> int:
+        """Код session_id в словаре сессий диалога (строка интернируется один раз)"""
+        codes = self._session_codes[dialogue_id]
+        code = codes.get(session_id)
+        if code is None:
+            vocab = self.session_vocab[dialogue_id]
+            code = codes[session_id] = len(vocab)
+            vocab.append(sys.intern(session_id))
+        return code
+    
+    @staticmethod
+    def _row_metadata(extra: Optional[Dict], session_id: str) -> Dict:
+        """Собирает метаданные строки для результата поиска"""
+        if not extra:
+            return {'session_id': session_id}
+        row = dict(extra)
+        row['session_id'] = session_id
+        return row
+    
+    @staticmethod
+    def _append_rows(views: Dict[str, np.ndarray], buffers: Dict[str, np.ndarray],
+                     dialogue_id: str, rows: np.ndarray):
+        """Дописывает строки в буфер диалога, views[dialogue_id] - заполненная часть"""
+        count = len(views[dialogue_id]) if dialogue_id in views else 0
+        needed = count + len(rows)
+        buffer = buffers.get(dialogue_id)
+        if buffer is None or needed > len(buffer):
+            capacity = max(needed, 2 * (len(buffer) if buffer is not None else 0), 64)
+            new_buffer = _aligned_empty((capacity,) + rows.shape[1:], rows.dtype)
+            if count:
+                new_buffer[:count] = buffer[:count]
+            buffer = buffers[dialogue_id] = new_buffer
+        if len(rows):
+            # Пустую запись пропускаем: буфер может быть read-only отображением
+            buffer[count:needed] = rows
+        views[dialogue_id] = buffer[:needed]
+    
+    @staticmethod
+    def _make_score_fn(metric: str, quantize: bool = False):
+        """
+        Возвращает функцию сходства (vectors N x dim, queries Q x dim) -> scores Q x N.
+        sq_norms - закэшированные квадраты норм строк (нужны только numpy euclidean)
+        """
+        if metric not in ("cosine", "euclidean", "dot"):
+            raise ValueError(f"Неизвестная метрика: {metric}")
+        
+        if SIMSIMD_AVAILABLE:
+            # SIMD-ядра с диспетчеризацией по CPU: один проход по матрице
+            def cdist(vectors: np.ndarray, queries: np.ndarray, kind: str) -> np.ndarray:
+                return np.asarray(simsimd.cdist(queries.astype(vectors.dtype, copy=False),
+                                                vectors, metric=kind, out_dtype='float32'))
+            
+            if metric == "cosine" and quantize:
+                def score(vectors: np.ndarray, queries: np.ndarray,
+                          sq_norms: Optional[np.ndarray] = None) -> np.ndarray:
+                    # Запросы квантуются той же шкалой: int8 x int8 -> 127^2 * cos
+                    queries_i8 = VectorStore._quantize_rows(VectorStore._unit_rows(queries))
+                    return cdist(vectors, queries_i8, 'inner') / (127.0 * 127.0)
+            elif metric == "cosine":
+                def score(vectors: np.ndarray, queries: np.ndarray,
+                          sq_norms: Optional[np.ndarray] = None) -> np.ndarray:
+                    # Векторы уже единичные - нормализуем только запросы
+                    return cdist(vectors, VectorStore._unit_rows(queries), 'inner')
+            elif metric == "euclidean":
+                def score(vectors: np.ndarray, queries: np.ndarray,
+                          sq_norms: Optional[np.ndarray] = None) -> np.ndarray:
+                    # Евклидово расстояние (инвертированное)
+                    distances = np.sqrt(cdist(vectors, queries, 'sqeuclidean'))
+                    return 1.0 / (1.0 + distances)
+            else:
+                def score(vectors: np.ndarray, queries: np.ndarray,
+                          sq_norms: Optional[np.ndarray] = None) -> np.ndarray:
+                    # Скалярное произведение
+                    return cdist(vectors, queries, 'inner')
+            return score
+        
+        if metric == "cosine":
+            def score(vectors: np.ndarray, queries: np.ndarray,
+                      sq_norms: Optional[np.ndarray] = None) -> np.ndarray:
+                # Векторы уже единичные - нормализуем только запросы, один GEMM
+                return VectorStore._unit_rows(queries) @ vectors.T
+        elif metric == "euclidean":
+            def score(vectors: np.ndarray, queries: np.ndarray,
+                      sq_norms: Optional[np.ndarray] = None) -> np.ndarray:
+                # Евклидово расстояние (инвертированное):
+                # ||q - v||^2 = ||q||^2 + ||v||^2 - 2 q.v - один GEMM на все запросы
+                if sq_norms is None:
+                    sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+                sq_dist = (
+                    np.einsum('ij,ij->i', queries, queries)[:, np.newaxis]
+                    + sq_norms[np.newaxis, :]
+                    - 2.0 * (queries @ vectors.T)
+                )
+                distances = np.sqrt(np.maximum(sq_dist, 0.0))
+                return 1.0 / (1.0 + distances)
         else:
-            valid_indices = np.arange(len(scores))
-        
-        if len(valid_indices) == 0:
-            return []
-        
-        # Находим топ-k
-        k = min(top_k, len(valid_indices))
-        top_indices_local = np.argpartition(scores[valid_indices], -k)[-k:]
-        top_indices = valid_indices[top_indices_local]
-        top_indices = top_indices[np.argsort(scores[top_indices])[::-1]]
-        
-        # Формируем результаты
-        results = []
-        for idx in top_indices:
-            result = {
-                'text': texts[idx],
-                'score': float(scores[idx]),
-                'metadata': metadata[idx].copy(),
-                'index': int(idx)
-            }
-            results.append(result)
-        
-        return results
+            def score(vectors: np.ndarray, queries: np.ndarray,
+                      sq_norms: Optional[np.ndarray] = None) -> np.ndarray:
+                # Скалярное произведение
+                return queries @ vectors.T
+        return score
+    
+    @staticmethod
+    def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+        """Нормализует строки матрицы до единичной длины"""
+        # einsum - один проход без промежуточного квадрата матрицы и без
+        # накладных расходов диспетчеризации np.linalg.norm
+        norms = np.sqrt(np.einsum('ij,ij->i', vectors, vectors))
+        return vectors / (norms[:, np.newaxis] + 1e-8)
+    
+    @staticmethod
+    def _quantize_rows(unit: np.ndarray) -> np.ndarray:
+        """Единичные векторы -> int8 с симметричной шкалой 127"""
+        return np.clip(np.rint(unit * 127.0), -127, 127).astype(np.int8)
+    
+    def _scored_rows(self, vectors: np.ndarray) -> np.ndarray:
+        """Строки для косинусного поиска: единичные fp32 или их int8-копия"""
+        unit = self._unit_rows(vectors)
+        return self._quantize_rows(unit) if self.quantize else unit
     
     def get_dialogue_stats(self, dialogue_id: str) -> Dict[str, Any]:
         """Получает статистику по диалогу"""
@@ -167,18 +469,30 @@ class VectorStore:
             'exists': True,
             'vectors_count': len(vectors),
             'dimensions': vectors.shape[1] if len(vectors) > 0 else 0,
-            'sessions': len(set(m.get('session_id', '') for m in self.dialogue_metadata[dialogue_id]))
+            'sessions': len(self.session_vocab[dialogue_id])
         }
     
     def clear_dialogue(self, dialogue_id: str):
         """Очищает данные диалога"""
         if dialogue_id in self.dialogue_vectors:
             count = len(self.dialogue_vectors[dialogue_id])
+            self._invalidate_scores(dialogue_id)
             del self.dialogue_vectors[dialogue_id]
             del self.dialogue_texts[dialogue_id]
             del self.dialogue_metadata[dialogue_id]
+            del self.dialogue_session_ids[dialogue_id]
+            del self.session_vocab[dialogue_id]
+            del self._session_codes[dialogue_id]
+            self._session_id_buffers.pop(dialogue_id, None)
+            self.dialogue_vectors_unit.pop(dialogue_id, None)
+            self._vector_buffers.pop(dialogue_id, None)
+            self._unit_buffers.pop(dialogue_id, None)
+            self.dialogue_sq_norms.pop(dialogue_id, None)
+            self._sq_norm_buffers.pop(dialogue_id, None)
             self.stats['total_vectors'] -= count
             self.stats['dialogues_count'] -= 1
+            if not self.dialogue_vectors:
+                self.shutdown()
             logger.info(f"Очищены данные диалога {dialogue_id}")
     
     def save(self, dialogue_id: str, filepath: str):
@@ -188,23 +502,37 @@ class VectorStore:
             return False
         
         data = {
-            'vectors': self.dialogue_vectors[dialogue_id],
             'texts': self.dialogue_texts[dialogue_id],
             'metadata': self.dialogue_metadata[dialogue_id],
+            'session_ids': self.dialogue_session_ids[dialogue_id].tolist(),
+            'session_vocab': self.session_vocab[dialogue_id],
             'metric': self.metric
         }
         
         filepath = Path(filepath)
         filepath.parent.mkdir(parents=True, exist_ok=True)
         
-        with open(filepath, 'wb') as f:
-            pickle.dump(data, f)
+        # Тексты и метаданные - JSON, матрица - .npy рядом: без поэлементной
+        # сериализации pickle и с возможностью отобразить векторы в память при загрузке
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        np.save(filepath.with_suffix('.npy'), self.dialogue_vectors[dialogue_id])
         
         logger.info(f"Индекс диалога {dialogue_id} сохранен в {filepath}")
         return True
     
-    def load(self, dialogue_id: str, filepath: str):
-        """Загружает индекс диалога с диска"""
+    def load(self, dialogue_id: str, filepath: str, mmap: bool = False):
+        """
+        Загружает индекс диалога с диска
+        
+        Args:
+            dialogue_id: ID диалога
+            filepath: Путь к файлу индекса
+            mmap: Отобразить матрицу .npy в память (read-only np.memmap) вместо
+                чтения в RAM - процессы делят страницы через page cache, первое
+                добавление скопирует матрицу в обычный буфер. По умолчанию матрица
+                читается в память целиком
+        """
         filepath = Path(filepath)
         if not filepath.exists():
             logger.warning(f"Файл {filepath} не найден")
@@ -212,11 +540,55 @@ class VectorStore:
         
         try:
             with open(filepath, 'rb') as f:
-                data = pickle.load(f)
+                payload = f.read()
             
-            self.dialogue_vectors[dialogue_id] = data['vectors']
+            if payload.startswith(b'{'):
+                data = json.loads(payload)
+                data['vectors'] = np.load(filepath.with_suffix('.npy'),
+                                          mmap_mode='r' if mmap else None)
+            else:
+                # Старый формат - pickle с матрицей внутри
+                data = pickle.loads(payload)
+            
+            self._invalidate_scores(dialogue_id)
+            vectors = data['vectors']
+            if vectors.dtype != np.float32 or not vectors.flags.c_contiguous:
+                vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            # Загруженная матрица становится буфером без запаса: первое
+            # добавление перенесёт её в буфер с ростом
+            self.dialogue_vectors[dialogue_id] = vectors
+            self._vector_buffers[dialogue_id] = vectors
             self.dialogue_texts[dialogue_id] = data['texts']
-            self.dialogue_metadata[dialogue_id] = data['metadata']
+            if 'session_vocab' in data:
+                metadata = data['metadata']
+                vocab = [sys.intern(sid) for sid in data['session_vocab']]
+                session_ids = np.asarray(data['session_ids'], dtype=np.int32)
+            else:
+                # Старый формат: session_id лежит в dict каждой строки
+                vocab, codes, session_ids, metadata = [], {}, [], []
+                for row in data['metadata']:
+                    row = dict(row)
+                    sid = row.pop('session_id', '')
+                    code = codes.get(sid)
+                    if code is None:
+                        code = codes[sid] = len(vocab)
+                        vocab.append(sys.intern(sid))
+                    session_ids.append(code)
+                    metadata.append(row or None)
+                session_ids = np.asarray(session_ids, dtype=np.int32)
+            self.dialogue_metadata[dialogue_id] = metadata
+            self.session_vocab[dialogue_id] = vocab
+            self._session_codes[dialogue_id] = {sid: i for i, sid in enumerate(vocab)}
+            self.dialogue_session_ids[dialogue_id] = session_ids
+            self._session_id_buffers[dialogue_id] = session_ids
+            if self.metric == "cosine":
+                unit = self._scored_rows(vectors)
+                self.dialogue_vectors_unit[dialogue_id] = unit
+                self._unit_buffers[dialogue_id] = unit
+            if self._track_sq_norms:
+                sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+                self.dialogue_sq_norms[dialogue_id] = sq_norms
+                self._sq_norm_buffers[dialogue_id] = sq_norms
             
             # Обновляем статистику
             self.stats['total_vectors'] += len(data['vectors'])
@@ -1,11 +1,12 @@
 """
 База данных для хранения и управления фактами
 """
+import sys
 import json
 import pickle
 import logging
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Set, Any
+from typing import Dict, List, Optional, Tuple, Set, FrozenSet, Any
 from datetime import datetime
 from collections import defaultdict
 from dataclasses import dataclass, field
@@ -15,6 +16,12 @@ from .fact_models import (
     TemporalFact, ConflictingFacts
 )
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
 
@@ -44,34 +51,36 @@ class FactIndex:
     """Индекс для быстрого поиска фактов"""
     
     def __init__(self):
-        # Индексы по разным критериям
-        self.by_type: Dict[FactType, List[str]] = defaultdict(list)
-        self.by_subject: Dict[str, List[str]] = defaultdict(list)
-        self.by_relation: Dict[FactRelation, List[str]] = defaultdict(list)
-        self.by_dialogue: Dict[str, List[str]] = defaultdict(list)
-        self.by_session: Dict[str, List[str]] = defaultdict(list)
+        # Индексы по разным критериям (множества - удаление за O(1))
+        self.by_type: Dict[FactType, Set[str]] = defaultdict(set)
+        self.by_subject: Dict[str, Set[str]] = defaultdict(set)
+        self.by_relation: Dict[FactRelation, Set[str]] = defaultdict(set)
+        self.by_dialogue: Dict[str, Set[str]] = defaultdict(set)
+        self.by_session: Dict[str, Set[str]] = defaultdict(set)
         
         # Индекс для поиска по объекту (значению)
-        self.by_object: Dict[str, List[str]] = defaultdict(list)
+        self.by_object: Dict[str, Set[str]] = defaultdict(set)
         
         # Полнотекстовый индекс (простой)
         self.text_index: Dict[str, Set[str]] = defaultdict(set)
+        # Слова каждого факта, посчитанные при индексации: удаление их не пересчитывает
+        self._fact_words: Dict[str, FrozenSet[str]] = {}
     
     def add_fact(self, fact: Fact):
         """Индексирует факт"""
         fact_id = fact.id
         
         # Добавляем в индексы
-        self.by_type[fact.type].append(fact_id)
-        self.by_subject[fact.subject].append(fact_id)
+        self.by_type[fact.type].add(fact_id)
+        self.by_subject[fact.subject].add(fact_id)
         if isinstance(fact.relation, FactRelation):
-            self.by_relation[fact.relation].append(fact_id)
-        self.by_dialogue[fact.dialogue_id].append(fact_id)
-        self.by_session[fact.session_id].append(fact_id)
+            self.by_relation[fact.relation].add(fact_id)
+        self.by_dialogue[fact.dialogue_id].add(fact_id)
+        self.by_session[fact.session_id].add(fact_id)
         
         # Индексируем объект
         object_lower = fact.object.lower()
-        self.by_object[object_lower].append(fact_id)
+        self.by_object[object_lower].add(fact_id)
         
         # Добавляем в текстовый индекс
         self._update_text_index(fact)
@@ -81,46 +90,52 @@ class FactIndex:
         fact_id = fact.id
         
         # Удаляем из всех индексов
-        self._remove_from_list(self.by_type[fact.type], fact_id)
-        self._remove_from_list(self.by_subject[fact.subject], fact_id)
+        self._discard(self.by_type, fact.type, fact_id)
+        self._discard(self.by_subject, fact.subject, fact_id)
         if isinstance(fact.relation, FactRelation):
-            self._remove_from_list(self.by_relation[fact.relation], fact_id)
-        self._remove_from_list(self.by_dialogue[fact.dialogue_id], fact_id)
-        self._remove_from_list(self.by_session[fact.session_id], fact_id)
-        
-        object_lower = fact.object.lower()
-        self._remove_from_list(self.by_object[object_lower], fact_id)
+            self._discard(self.by_relation, fact.relation, fact_id)
+        self._discard(self.by_dialogue, fact.dialogue_id, fact_id)
+        self._discard(self.by_session, fact.session_id, fact_id)
+        self._discard(self.by_object, fact.object.lower(), fact_id)
         
         # Удаляем из текстового индекса
         self._remove_from_text_index(fact)
     
+    @staticmethod
+    def _text_words(fact: Fact) -> FrozenSet[str]:
+        """Слова факта для текстового индекса"""
+        # Слова из объекта факта и первые 20 слов raw_text если есть
+        words = fact.object.lower().split()
+        if fact.raw_text:
+            words += fact.raw_text.lower().split()[:20]
+        # Индексируем слова длиннее 2 символов; intern - одна копия
+        # частых слов на весь индекс и быстрое сравнение ключей
+        return frozenset(sys.intern(word) for word in words if len(word) > 2)
+    
     def _update_text_index(self, fact: Fact):
         """Обновляет текстовый индекс"""
-        # Извлекаем слова из объекта факта
-        words = fact.object.lower().split()
+        words = self._text_words(fact)
+        self._fact_words[fact.id] = words
         for word in words:
-            if len(word) > 2:  # Индексируем слова длиннее 2 символов
-                self.text_index[word].add(fact.id)
-        
-        # Также индексируем слова из raw_text если есть
-        if fact.raw_text:
-            words = fact.raw_text.lower().split()[:20]  # Первые 20 слов
-            for word in words:
-                if len(word) > 2:
-                    self.text_index[word].add(fact.id)
+            self.text_index[word].add(fact.id)
     
     def _remove_from_text_index(self, fact: Fact):
         """Удаляет факт из текстового индекса"""
-        # Удаляем из всех множеств где есть fact.id
-        for word_set in self.text_index.values():
-            word_set.discard(fact.id)
+        # Только из постингов слов самого факта, а не обходом всего индекса
+        words = self._fact_words.pop(fact.id, None)
+        if words is None:
+            words = self._text_words(fact)
+        for word in words:
+            self._discard(self.text_index, word, fact.id)
     
-    def _remove_from_list(self, lst: List, item):
-        """Безопасно удаляет элемент из списка"""
-        try:
-            lst.remove(item)
-        except ValueError:
-            pass
+    @staticmethod
+    def _discard(index: Dict[Any, Set[str]], key: Any, fact_id: str):
+        """Безопасно удаляет id из постинга, пустые постинги убирает"""
+        postings = index.get(key)
+        if postings is not None:
+            postings.discard(fact_id)
+            if not postings:
+                del index[key]
     
     def search_by_text(self, query: str) -> Set[str]:
         """Полнотекстовый поиск"""
@@ -142,6 +157,7 @@ class FactIndex:
         self.by_session.clear()
         self.by_object.clear()
         self.text_index.clear()
+        self._fact_words.clear()
 
 
 class FactConflictResolver:
@@ -332,19 +348,20 @@ class FactDatabase:
             min_confidence: Минимальная уверенность
             
         Returns:
-            Список найденных фактов
+            Список найденных фактов по убыванию уверенности, при равной
+            уверенности - в порядке добавления в диалог
         """
         # Начинаем с фактов диалога
-        dialogue_fact_ids = set(self.dialogue_facts.get(dialogue_id, []))
+        dialogue_fact_ids = self.dialogue_facts.get(dialogue_id, [])
         
         if not dialogue_fact_ids:
             return []
         
-        result_ids = dialogue_fact_ids
+        result_ids = set(dialogue_fact_ids)
         
         # Фильтруем по типу
         if fact_type:
-            type_ids = set(self.index.by_type[fact_type])
+            type_ids = self.index.by_type.get(fact_type, set())
             result_ids = result_ids.intersection(type_ids)
         
         # Полнотекстовый поиск
@@ -353,10 +370,11 @@ class FactDatabase:
             if text_ids:
                 result_ids = result_ids.intersection(text_ids)
         
-        # Получаем факты
+        # Получаем факты. Постинги индекса - множества без порядка, поэтому
+        # обходим список диалога и оставляем попавшие в result_ids
         facts = []
-        for fact_id in result_ids:
-            if fact_id in self.facts:
+        for fact_id in dialogue_fact_ids:
+            if fact_id in result_ids and fact_id in self.facts:
                 fact = self.facts[fact_id]
                 if fact.confidence.score >= min_confidence:
                     facts.append(fact)
@@ -622,8 +640,19 @@ class FactDatabase:
         Args:
             filepath: Путь к файлу
         """
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(filepath, 'rb') as f:
+            payload = f.read()
+        
+        # orjson разбирает байты напрямую в разы быстрее; на том, что он отвергает
+        # (например, NaN), откатываемся на более терпимый json
+        data = None
+        if ORJSON_AVAILABLE:
+            try:
+                data = orjson.loads(payload)
+            except orjson.JSONDecodeError:
+                pass
+        if data is None:
+            data = json.loads(payload.decode('utf-8'))
         
         # Очищаем текущую базу
         self.facts.clear()
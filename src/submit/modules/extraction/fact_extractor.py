@@ -4,21 +4,83 @@
 """
 import json
 import re
+import sys
 import logging
+import hashlib
+from collections import Counter, OrderedDict
+from datetime import datetime
 from typing import List, Dict, Any, Optional, Union
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
 from .fact_models import Fact, FactType, FactRelation, FactConfidence, TemporalFact
 from .fact_patterns import (
-    FACT_PATTERNS, extract_with_pattern, extract_all_with_patterns,
+    FACT_PATTERNS, candidate_patterns, extract_with_pattern, extract_all_with_patterns,
     detect_temporal_context, normalize_value, confidence_from_pattern_match,
     get_relation_for_type
 )
 
 logger = logging.getLogger(__name__)
 
+# Сложные паттерны SmartFactExtractor, скомпилированные один раз при загрузке модуля.
+# Варианты одной категории объединены: один проход по тексту вместо нескольких search
+_MARRIAGE_RE = re.compile(
+    r'(?:женился|женюсь|женился недавно|вчера женился)'
+    r'|(?:вышла замуж|выхожу замуж|замуж вышла)'
+    r'|(?:поженились|свадьба была|сыграли свадьбу)',
+    re.IGNORECASE
+)
+_DIVORCE_RE = re.compile(
+    r'(?:развелся|развелась|разводимся)'
+    r'|(?:расстались|разошлись|больше не вместе)',
+    re.IGNORECASE
+)
+# Смена работы: каждый вариант ищется отдельно - компания берётся после его
+# первого совпадения
+_JOB_CHANGE_RES = (
+    re.compile(r'(?:уволился|ушел с работы|больше не работаю)', re.IGNORECASE),
+    re.compile(r'(?:перешел в|теперь работаю в|сменил работу)', re.IGNORECASE),
+    re.compile(r'(?:новая работа|новое место)', re.IGNORECASE),
+)
+_COMPANY_RE = re.compile(r'(?:в|на)\s+([А-ЯЁ][а-яё]+(?:\s+[А-ЯЁ]?[а-яё]+)*)')
+
+
+# Субъект всех фактов из правил - одна интернированная строка на все факты
+_USER = sys.intern("пользователь")
+
+# Отношение зависит только от типа факта - запоминаем его между текстами
+_RELATION_BY_TYPE: Dict[FactType, Union[FactRelation, str]] = {}
+
+
+def _relation_for_type(fact_type: FactType) -> Union[FactRelation, str]:
+    """get_relation_for_type с памятью; enum оставляем как есть, иное - строкой"""
+    relation = _RELATION_BY_TYPE.get(fact_type)
+    if relation is None:
+        relation = get_relation_for_type(fact_type)
+        # Enum передаём в Fact как есть: он не ищет его заново по строке
+        if not isinstance(relation, FactRelation):
+            relation = str(relation)
+        _RELATION_BY_TYPE[fact_type] = relation
+    return relation
+
+
+# Тексты длиннее не кэшируются - ключ и шаблоны фактов не должны раздувать память
+_CACHE_MAX_TEXT_LEN = 4096
+
 
-@dataclass
+def _clone_fact(fact: Fact, session_id: str, dialogue_id: str) -> Fact:
+    """Независимая копия факта (своя уверенность и атрибуты) для другой сессии/диалога"""
+    confidence = fact.confidence
+    return replace(
+        fact,
+        confidence=FactConfidence(confidence.score, confidence.source, confidence.evidence_count),
+        session_id=session_id,
+        dialogue_id=dialogue_id,
+        extracted_at=datetime.now(),
+        attributes=dict(fact.attributes)
+    )
+
+
+@dataclass(slots=True)
 class ExtractionStats:
     """Статистика извлечения фактов"""
     total_extracted: int = 0
@@ -28,8 +90,8 @@ class ExtractionStats:
     conflicts_found: int = 0
     
     def __post_init__(self):
-        if self.facts_by_type is None:
-            self.facts_by_type = {}
+        # Counter: счётчики по типам пополняются одним update на вызов
+        self.facts_by_type = Counter(self.facts_by_type or ())
     
     def to_dict(self) -> Dict:
         return {
@@ -64,6 +126,12 @@ class FactExtractor:
     def get_stats(self) -> Dict:
         """Возвращает статистику извлечения"""
         return self.stats.to_dict()
+    
+    @staticmethod
+    def _bulk_update(stats: ExtractionStats, facts: List[Fact]):
+        """Учитывает факты вызова в статистике: общий счётчик и один update по типам"""
+        stats.total_extracted += len(facts)
+        stats.facts_by_type.update([fact.type.value for fact in facts])
 
 
 class RuleBasedFactExtractor(FactExtractor):
@@ -72,14 +140,26 @@ class RuleBasedFactExtractor(FactExtractor):
     Использует только внутренние паттерны, не зависит от внешних модулей
     """
     
-    def __init__(self, min_confidence: float = 0.5):
+    def __init__(self, min_confidence: float = 0.5, cache_size: int = 8192):
         super().__init__()
         self.min_confidence = min_confidence
         # Предкомпилируем критические паттерны для скорости
         self._compile_critical_patterns()
+        
+        # LRU по хэшу текста и min_confidence: одни и те же реплики повторяются
+        # между сессиями, повтор не гоняет паттерны заново. Храним шаблоны фактов
+        # и прирост статистики. После ручной правки critical_patterns - clear_cache()
+        self.cache_size = cache_size
+        self._facts_cache: OrderedDict = OrderedDict()
+    
+    def clear_cache(self):
+        """Сбрасывает кэш извлечения (после смены набора паттернов)"""
+        self._facts_cache.clear()
     
     def _compile_critical_patterns(self):
         """Предкомпилирует критические паттерны для ускорения"""
+        if hasattr(self, '_facts_cache'):
+            self.clear_cache()
         # Критические для конкурса
         self.critical_patterns = {
             'name': FACT_PATTERNS.get(FactType.PERSONAL_NAME, [])[:3],  # Топ-3 паттерна для имени
@@ -89,10 +169,62 @@ class RuleBasedFactExtractor(FactExtractor):
     
     def extract_facts_from_text(self, text: str, session_id: str, dialogue_id: str) -> List[Fact]:
         """Извлекает факты используя паттерны - БЕЗОПАСНАЯ ВЕРСИЯ"""
+        if self.cache_size <= 0 or len(text) > _CACHE_MAX_TEXT_LEN:
+            return self._extract_facts(text, session_id, dialogue_id)
+        
+        # UTF-8 кодируем один раз: и для ключа кэша, и для скана Hyperscan
+        encoded = text.encode('utf-8')
+        key = (hashlib.blake2b(encoded, digest_size=16).digest(), self.min_confidence)
+        cached = self._facts_cache.get(key)
+        if cached is not None:
+            self._facts_cache.move_to_end(key)
+            templates, extracted, matched, by_type = cached
+            # Статистика растёт так же, как при реальном извлечении
+            self.stats.total_extracted += extracted
+            self.stats.patterns_matched += matched
+            self.stats.rules_used += 1
+            self.stats.facts_by_type.update(by_type)
+            return [_clone_fact(fact, session_id, dialogue_id) for fact in templates]
+        
+        total_before = self.stats.total_extracted
+        matched_before = self.stats.patterns_matched
+        by_type = Counter()
+        
+        facts = self._extract_facts(text, session_id, dialogue_id, encoded, by_type)
+        
+        # Шаблоны - копии: возвращённые факты дальше меняются (уверенность и т.п.)
+        self._facts_cache[key] = (
+            [_clone_fact(fact, session_id, dialogue_id) for fact in facts],
+            self.stats.total_extracted - total_before,
+            self.stats.patterns_matched - matched_before,
+            by_type
+        )
+        if len(self._facts_cache) > self.cache_size:
+            self._facts_cache.popitem(last=False)
+        
+        return facts
+    
+    def _extract_facts(self, text: str, session_id: str, dialogue_id: str,
+                       encoded: Optional[bytes] = None,
+                       by_type: Optional[Counter] = None) -> List[Fact]:
+        """
+        Прогоняет паттерны по тексту (без кэша)
+        by_type - счётчик по типам за этот вызов; в статистику он вливается
+        одним update в конце
+        """
         facts = []
+        if by_type is None:
+            by_type = Counter()
+        # Фрагмент для контекста режем один раз - все факты текста делят одну строку
+        raw_text = text[:200]
+        
+        # Один проход по тексту всеми паттернами сразу (Hyperscan) - дальше re
+        # запускается только для паттернов, которые могут совпасть, включая критические
+        candidates = candidate_patterns(text, encoded)
         
         # Сначала извлекаем критические факты
-        critical_facts = self._extract_critical_facts(text, session_id, dialogue_id)
+        critical_facts = self._extract_critical_facts(text, session_id, dialogue_id, raw_text,
+                                                      candidates)
         facts.extend(critical_facts)
         
         # Затем все остальные с обработкой ошибок
@@ -102,8 +234,14 @@ class RuleBasedFactExtractor(FactExtractor):
                 if fact_type in [FactType.PERSONAL_NAME, FactType.PERSONAL_AGE, FactType.FAMILY_STATUS]:
                     continue
                 
+                matched_patterns = candidates.get(fact_type)
+                if not matched_patterns:
+                    continue
+                
                 # Извлекаем все значения по паттернам
-                values = extract_all_with_patterns(text, patterns)
+                values = extract_all_with_patterns(text, matched_patterns)
+                patterns_count = len(patterns)
+                relation = None
                 
                 for i, value in enumerate(values):
                     try:
@@ -111,23 +249,18 @@ class RuleBasedFactExtractor(FactExtractor):
                         normalized_value = normalize_value(value, fact_type)
                         
                         # Рассчитываем уверенность
-                        confidence_score = confidence_from_pattern_match(i, len(patterns))
+                        confidence_score = confidence_from_pattern_match(i, patterns_count)
                         
                         if confidence_score >= self.min_confidence:
-                            # Определяем отношение
-                            relation = get_relation_for_type(fact_type)
-                            
-                            # Безопасное получение значения relation
-                            if isinstance(relation, FactRelation):
-                                relation_value = relation.value
-                            else:
-                                relation_value = str(relation)
+                            # Определяем отношение (одно на тип, не на каждое значение)
+                            if relation is None:
+                                relation = _relation_for_type(fact_type)
                             
                             # Создаем факт
                             fact = Fact(
                                 type=fact_type,
-                                subject="пользователь",
-                                relation=relation_value,
+                                subject=_USER,
+                                relation=relation,
                                 object=normalized_value,
                                 confidence=FactConfidence(
                                     score=confidence_score,
@@ -135,7 +268,7 @@ class RuleBasedFactExtractor(FactExtractor):
                                 ),
                                 session_id=session_id,
                                 dialogue_id=dialogue_id,
-                                raw_text=text[:200]  # Сохраняем фрагмент для контекста
+                                raw_text=raw_text  # Сохраняем фрагмент для контекста
                             )
                             
                             facts.append(fact)
@@ -144,8 +277,7 @@ class RuleBasedFactExtractor(FactExtractor):
                             
                             # Безопасное обновление статистики
                             fact_type_str = fact_type.value if hasattr(fact_type, 'value') else str(fact_type)
-                            self.stats.facts_by_type[fact_type_str] = \
-                                self.stats.facts_by_type.get(fact_type_str, 0) + 1
+                            by_type[fact_type_str] += 1
                                 
                     except Exception as e:
                         logger.debug(f"Failed to process value {value} for type {fact_type}: {e}")
@@ -156,6 +288,7 @@ class RuleBasedFactExtractor(FactExtractor):
                 continue
         
         self.stats.rules_used += 1
+        self.stats.facts_by_type.update(by_type)
         
         # Детектируем временной контекст для фактов
         try:
@@ -167,31 +300,43 @@ class RuleBasedFactExtractor(FactExtractor):
         
         return facts
     
-    def _extract_critical_facts(self, text: str, session_id: str, dialogue_id: str) -> List[Fact]:
+    def _extract_critical_facts(self, text: str, session_id: str, dialogue_id: str,
+                                raw_text: Optional[str] = None,
+                                candidates: Optional[Dict[FactType, List]] = None) -> List[Fact]:
         """Извлекает критические факты с повышенной точностью"""
         critical_facts = []
+        if raw_text is None:
+            raw_text = text[:200]
+        if candidates is None:
+            candidates = candidate_patterns(text)
         
         # Извлечение имени - КРИТИЧНО!
+        name_candidates = candidates.get(FactType.PERSONAL_NAME, ())
         for pattern in self.critical_patterns['name']:
+            if pattern not in name_candidates:
+                continue
             match = pattern.search(text)
             if match:
                 name = match.group(1).strip()
                 fact = Fact(
                     type=FactType.PERSONAL_NAME,
-                    subject="пользователь",
-                    relation=FactRelation.IS.value,
+                    subject=_USER,
+                    relation=FactRelation.IS,
                     object=name.title(),  # Нормализуем имя
                     confidence=FactConfidence(score=0.95, source="critical_pattern"),
                     session_id=session_id,
                     dialogue_id=dialogue_id,
-                    raw_text=text[:200]
+                    raw_text=raw_text
                 )
                 critical_facts.append(fact)
                 self.stats.total_extracted += 1
                 break  # Берем первое найденное имя
         
         # Извлечение возраста
+        age_candidates = candidates.get(FactType.PERSONAL_AGE, ())
         for pattern in self.critical_patterns['age']:
+            if pattern not in age_candidates:
+                continue
             match = pattern.search(text)
             if match:
                 age = match.group(1)
@@ -200,13 +345,13 @@ class RuleBasedFactExtractor(FactExtractor):
                     if 0 < age_int < 150:
                         fact = Fact(
                             type=FactType.PERSONAL_AGE,
-                            subject="пользователь",
-                            relation=FactRelation.IS.value,
+                            subject=_USER,
+                            relation=FactRelation.IS,
                             object=str(age_int),
                             confidence=FactConfidence(score=0.9, source="critical_pattern"),
                             session_id=session_id,
                             dialogue_id=dialogue_id,
-                            raw_text=text[:200]
+                            raw_text=raw_text
                         )
                         critical_facts.append(fact)
                         self.stats.total_extracted += 1
@@ -271,85 +416,64 @@ class SmartFactExtractor(FactExtractor):
         all_facts.extend(complex_facts)
         
         # Обновляем статистику
-        self.stats.total_extracted += len(all_facts)
-        for fact in all_facts:
-            self.stats.facts_by_type[fact.type.value] = \
-                self.stats.facts_by_type.get(fact.type.value, 0) + 1
+        self._bulk_update(self.stats, all_facts)
         
         # Убираем дубликаты
         all_facts = self._deduplicate_facts(all_facts)
         
         return all_facts
     
-    def _extract_complex_patterns(self, text: str, session_id: str, dialogue_id: str) -> List[Fact]:
+    def _extract_complex_patterns(self, text: str, session_id: str, dialogue_id: str,
+                                  raw_text: Optional[str] = None) -> List[Fact]:
         """Извлекает факты по сложным паттернам"""
         complex_facts = []
+        if raw_text is None:
+            raw_text = text[:200]
         
         # Паттерн: "женился/вышла замуж" -> изменение статуса
-        marriage_patterns = [
-            r'(?:женился|женюсь|женился недавно|вчера женился)',
-            r'(?:вышла замуж|выхожу замуж|замуж вышла)',
-            r'(?:поженились|свадьба была|сыграли свадьбу)'
-        ]
-        
-        for pattern in marriage_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                fact = Fact(
-                    type=FactType.FAMILY_STATUS,
-                    subject="пользователь",
-                    relation=FactRelation.IS.value,
-                    object="женат" if "женился" in text.lower() else "замужем",
-                    confidence=FactConfidence(score=0.9, source="complex_pattern"),
-                    session_id=session_id,
-                    dialogue_id=dialogue_id,
-                    raw_text=text[:200]
-                )
-                complex_facts.append(fact)
-                break
+        if _MARRIAGE_RE.search(text):
+            fact = Fact(
+                type=FactType.FAMILY_STATUS,
+                subject=_USER,
+                relation=FactRelation.IS,
+                object="женат" if "женился" in text.lower() else "замужем",
+                confidence=FactConfidence(score=0.9, source="complex_pattern"),
+                session_id=session_id,
+                dialogue_id=dialogue_id,
+                raw_text=raw_text
+            )
+            complex_facts.append(fact)
         
         # Паттерн: "развелся/разошлись"
-        divorce_patterns = [
-            r'(?:развелся|развелась|разводимся)',
-            r'(?:расстались|разошлись|больше не вместе)'
-        ]
-        
-        for pattern in divorce_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                fact = Fact(
-                    type=FactType.FAMILY_STATUS,
-                    subject="пользователь",
-                    relation=FactRelation.IS.value,
-                    object="разведен",
-                    confidence=FactConfidence(score=0.85, source="complex_pattern"),
-                    session_id=session_id,
-                    dialogue_id=dialogue_id,
-                    raw_text=text[:200]
-                )
-                complex_facts.append(fact)
-                break
+        if _DIVORCE_RE.search(text):
+            fact = Fact(
+                type=FactType.FAMILY_STATUS,
+                subject=_USER,
+                relation=FactRelation.IS,
+                object="разведен",
+                confidence=FactConfidence(score=0.85, source="complex_pattern"),
+                session_id=session_id,
+                dialogue_id=dialogue_id,
+                raw_text=raw_text
+            )
+            complex_facts.append(fact)
         
         # Паттерн: смена работы
-        job_change_patterns = [
-            r'(?:уволился|ушел с работы|больше не работаю)',
-            r'(?:перешел в|теперь работаю в|сменил работу)',
-            r'(?:новая работа|новое место)'
-        ]
-        
-        for pattern in job_change_patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for pattern in _JOB_CHANGE_RES:
+            match = pattern.search(text)
             if match:
                 # Ищем название новой компании
-                company_match = re.search(r'(?:в|на)\s+([А-ЯЁ][а-яё]+(?:\s+[А-ЯЁ]?[а-яё]+)*)', text[match.end():])
+                company_match = _COMPANY_RE.search(text, match.end())
                 if company_match:
                     fact = Fact(
                         type=FactType.WORK_COMPANY,
-                        subject="пользователь",
-                        relation=FactRelation.WORKS_AT.value,
+                        subject=_USER,
+                        relation=FactRelation.WORKS_AT,
                         object=company_match.group(1),
                         confidence=FactConfidence(score=0.8, source="complex_pattern"),
                         session_id=session_id,
                         dialogue_id=dialogue_id,
-                        raw_text=text[:200]
+                        raw_text=raw_text
                     )
                     complex_facts.append(fact)
         
@@ -357,27 +481,21 @@ class SmartFactExtractor(FactExtractor):
     
     def _deduplicate_facts(self, facts: List[Fact]) -> List[Fact]:
         """Убирает дубликаты фактов"""
-        seen = set()
-        unique_facts = []
+        # Ключ дедупликации -> первый факт с этим ключом (порядок сохраняется)
+        by_key = {}
         
         for fact in facts:
-            # Создаем ключ для дедупликации
             key = (fact.type.value, fact.subject, fact.object.lower())
+            existing = by_key.get(key)
             
-            if key not in seen:
-                seen.add(key)
-                unique_facts.append(fact)
+            if existing is None:
+                by_key[key] = fact
             else:
                 # Если дубликат, повышаем уверенность у существующего
-                for existing in unique_facts:
-                    if (existing.type == fact.type and 
-                        existing.subject == fact.subject and
-                        existing.object.lower() == fact.object.lower()):
-                        existing.confidence.update(fact.confidence.score)
-                        existing.confidence.evidence_count += 1
-                        break
+                existing.confidence.update(fact.confidence.score)
+                existing.confidence.evidence_count += 1
         
-        return unique_facts
+        return list(by_key.values())
 
 
 class HybridFactExtractor(FactExtractor):
@@ -401,10 +519,16 @@ class HybridFactExtractor(FactExtractor):
         rule_facts = self.rule_extractor.extract_facts_from_text(text, session_id, dialogue_id)
         self.stats.rules_used += 1
         
-        # Определяем, нужны ли дополнительные методы
-        high_confidence_rules = [f for f in rule_facts if f.confidence.score >= self.rule_confidence_threshold]
+        # Определяем, нужны ли дополнительные методы: считаем уверенные факты
+        # только до трёх, без промежуточного списка
+        high_confidence_count = 0
+        for fact in rule_facts:
+            if fact.confidence.score >= self.rule_confidence_threshold:
+                high_confidence_count += 1
+                if high_confidence_count >= 3:
+                    break
         
-        if len(high_confidence_rules) >= 3:
+        if high_confidence_count >= 3:
             # Если правилами извлечено достаточно фактов с высокой уверенностью
             all_facts = rule_facts
         else:
@@ -415,10 +539,7 @@ class HybridFactExtractor(FactExtractor):
             all_facts = self._merge_facts(rule_facts, smart_facts)
         
         # Обновляем статистику
-        self.stats.total_extracted += len(all_facts)
-        for fact in all_facts:
-            self.stats.facts_by_type[fact.type.value] = \
-                self.stats.facts_by_type.get(fact.type.value, 0) + 1
+        self._bulk_update(self.stats, all_facts)
         
         return all_facts
     
@@ -426,20 +547,23 @@ class HybridFactExtractor(FactExtractor):
         """Объединяет факты из разных источников"""
         merged = rule_facts.copy()
         
+        # Индекс фактов строится один раз: O(N+M) вместо O(N*M)
+        by_key = {}
+        for rule_fact in rule_facts:
+            by_key.setdefault(
+                (rule_fact.type.value, rule_fact.subject, rule_fact.object.lower()), rule_fact
+            )
+        
         for smart_fact in smart_facts:
-            # Проверяем, есть ли похожий факт из правил
-            is_duplicate = False
-            for rule_fact in rule_facts:
-                if (smart_fact.type == rule_fact.type and 
-                    smart_fact.subject == rule_fact.subject and
-                    smart_fact.object.lower() == rule_fact.object.lower()):
-                    is_duplicate = True
-                    # Обновляем уверенность существующего факта
-                    rule_fact.confidence.update(smart_fact.confidence.score)
-                    self.stats.conflicts_found += 1
-                    break
-            
-            if not is_duplicate:
+            # Проверяем, есть ли уже такой факт (из правил или добавленный выше)
+            key = (smart_fact.type.value, smart_fact.subject, smart_fact.object.lower())
+            existing = by_key.get(key)
+            if existing is not None:
+                # Обновляем уверенность существующего факта
+                existing.confidence.update(smart_fact.confidence.score)
+                self.stats.conflicts_found += 1
+            else:
                 merged.append(smart_fact)
+                by_key[key] = smart_fact
         
         return merged
\ No newline at end of file
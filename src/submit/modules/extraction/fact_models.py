@@ -278,7 +278,8 @@ class FactRelation(Enum):
     RELATES_TO = "relates_to"    # относится к
 
 
-@dataclass
+# slots: создаётся на каждый извлечённый факт - без __dict__ объект меньше
+@dataclass(slots=True)
 class FactConfidence:
     """Уровень уверенности в факте"""
     score: float  # от 0.0 до 1.0
@@ -312,7 +313,7 @@ class FactConfidence:
         self.score = max(0.0, min(1.0, self.score))
 
 
-@dataclass
+@dataclass(slots=True)
 class Fact:
     """Базовый класс для представления факта"""
     # Основные поля
@@ -331,6 +332,9 @@ class Fact:
     extracted_at: datetime = field(default_factory=datetime.now)  # Время извлечения
     attributes: Dict[str, Any] = field(default_factory=dict)  # Дополнительные атрибуты
     
+    # ID по содержимому, вычисляется в __post_init__ (поле нужно для slots)
+    id: str = field(init=False, repr=False, compare=False)
+    
     def __post_init__(self):
         """Постобработка после создания"""
         # Преобразуем строку в FactRelation если нужно
@@ -447,7 +451,7 @@ class Fact:
         return f"Fact(id={self.id}, type={self.type.value}, object={self.object})"
 
 
-@dataclass
+@dataclass(slots=True)
 class TemporalFact(Fact):
     """Факт с временной меткой"""
     timestamp: Optional[datetime] = None  # Когда факт был актуален
@@ -465,7 +469,8 @@ class TemporalFact(Fact):
     
     def to_dict(self) -> Dict[str, Any]:
         """Преобразует временной факт в словарь"""
-        data = super().to_dict()
+        # Явный вызов: slots-dataclass пересоздаёт класс, и super() без аргументов в нём не работает
+        data = Fact.to_dict(self)
         data['temporal'] = {
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
             'valid_from': self.valid_from.isoformat() if self.valid_from else None,
@@ -2,9 +2,19 @@
 Паттерны для извлечения фактов из текста - УЛУЧШЕННАЯ ВЕРСИЯ
 """
 import re
+import logging
+import threading
 from typing import Dict, List, Tuple, Optional, Pattern
 from .fact_models import FactType, FactRelation
 
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
 
 # Расширенные паттерны для извлечения фактов
 FACT_PATTERNS: Dict[FactType, List[Pattern]] = {
@@ -479,6 +489,77 @@ def compile_patterns() -> Dict[str, List[Pattern]]:
     return compiled
 
 
+# Мульти-паттерновая база Hyperscan по всем FACT_PATTERNS, компилируется при первом использовании
+_hs_database = None
+_hs_patterns: List[Tuple[FactType, Pattern]] = []
+_hs_lock = threading.Lock()
+
+
+def _get_hs_database():
+    """Лениво компилирует все FACT_PATTERNS в одну базу Hyperscan"""
+    global _hs_database, HYPERSCAN_AVAILABLE
+    if _hs_database is not None or not HYPERSCAN_AVAILABLE:
+        return _hs_database
+    
+    with _hs_lock:
+        if _hs_database is None and HYPERSCAN_AVAILABLE:
+            patterns = [(fact_type, pattern)
+                        for fact_type, type_patterns in FACT_PATTERNS.items()
+                        for pattern in type_patterns]
+            # PREFILTER: неподдерживаемые конструкции аппроксимируются надмножеством,
+            # точное совпадение и группы потом даёт re только по кандидатам
+            base_flags = (hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP |
+                          hyperscan.HS_FLAG_PREFILTER | hyperscan.HS_FLAG_SINGLEMATCH)
+            try:
+                database = hyperscan.Database()
+                database.compile(
+                    expressions=[pattern.pattern.encode('utf-8') for _, pattern in patterns],
+                    ids=list(range(len(patterns))),
+                    elements=len(patterns),
+                    flags=[base_flags | (hyperscan.HS_FLAG_CASELESS if pattern.flags & re.IGNORECASE else 0)
+                           for _, pattern in patterns]
+                )
+                _hs_patterns[:] = patterns
+                _hs_database = database
+            except Exception as e:
+                logger.warning(f"Hyperscan не смог скомпилировать паттерны, используем re: {e}")
+                HYPERSCAN_AVAILABLE = False
+    
+    return _hs_database
+
+
+def candidate_patterns(text: str, encoded: Optional[bytes] = None) -> Dict[FactType, List[Pattern]]:
+    """
+    Паттерны FACT_PATTERNS, которые могут совпасть с текстом.
+    
+    С Hyperscan текст сканируется один раз сразу всеми паттернами; для каждого
+    типа возвращаются только кандидаты в исходном порядке. Без Hyperscan -
+    все паттерны (FACT_PATTERNS)
+    
+    Args:
+        text: Текст для поиска
+        encoded: Тот же текст в UTF-8, если вызывающий уже закодировал его
+        
+    Returns:
+        Словарь тип факта -> паттерны-кандидаты
+    """
+    database = _get_hs_database()
+    if database is None:
+        return FACT_PATTERNS
+    
+    hits = []
+    if encoded is None:
+        encoded = text.encode('utf-8')
+    database.scan(encoded,
+                  match_event_handler=lambda pattern_id, start, end, flags, context: hits.append(pattern_id))
+    
+    candidates: Dict[FactType, List[Pattern]] = {}
+    for pattern_id in sorted(hits):
+        fact_type, pattern = _hs_patterns[pattern_id]
+        candidates.setdefault(fact_type, []).append(pattern)
+    return candidates
+
+
 def get_fact_pattern(fact_type: FactType) -> List[Pattern]:
     """Возвращает паттерны для конкретного типа факта"""
     return FACT_PATTERNS.get(fact_type, [])
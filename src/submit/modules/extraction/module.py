@@ -12,6 +12,12 @@ import logging
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
 
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+
 # Добавляем путь к models
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
@@ -189,8 +195,11 @@ class ExtractionModule(IFactExtractor):
                 text = text[:self.config.get('max_text_length', 10000)]
                 logger.warning(f"Text truncated to {len(text)} chars")
             
+            # Нижний регистр считаем один раз - его разделяют все проверки маркеров ниже
+            text_lower = text.lower()
+            
             # ФИЛЬТРАЦИЯ КОПИПАСТА
-            if self.config.get('filter_copypaste', True) and self._is_copypaste(text):
+            if self.config.get('filter_copypaste', True) and self._is_copypaste(text, text_lower):
                 self.stats['copypaste_filtered'] += 1
                 return ProcessingResult(
                     success=True,
@@ -199,7 +208,7 @@ class ExtractionModule(IFactExtractor):
                 )
             
             # Определяем тип сообщения для оптимизации кэширования
-            is_info_update = self._detect_info_update(text)
+            is_info_update = self._detect_info_update(text, text_lower)
             if is_info_update:
                 self.stats['info_updates_detected'] += 1
                 # Для обновлений информации используем короткий TTL
@@ -230,7 +239,8 @@ class ExtractionModule(IFactExtractor):
                 
                 # Дополнительное извлечение для info_updating вопросов
                 if is_info_update:
-                    update_facts = self._extract_update_facts(text, session_id, dialogue_id)
+                    update_facts = self._extract_update_facts(text, session_id, dialogue_id,
+                                                              text_lower)
                     facts.extend(update_facts)
                 
             except Exception as extract_error:
@@ -414,7 +424,7 @@ class ExtractionModule(IFactExtractor):
     
     # === НОВЫЕ МЕТОДЫ ДЛЯ УЛУЧШЕННОГО ИЗВЛЕЧЕНИЯ ===
     
-    def _detect_info_update(self, text: str) -> bool:
+    def _detect_info_update(self, text: str, text_lower: Optional[str] = None) -> bool:
         """
         Определяет, является ли текст обновлением информации
         """
@@ -428,15 +438,19 @@ class ExtractionModule(IFactExtractor):
             'уволился', 'устроился', 'повысили'
         ]
         
-        text_lower = text.lower()
+        if text_lower is None:
+            text_lower = text.lower()
         return any(marker in text_lower for marker in update_markers)
     
-    def _extract_update_facts(self, text: str, session_id: str, dialogue_id: str) -> List:
+    def _extract_update_facts(self, text: str, session_id: str, dialogue_id: str,
+                              text_lower: Optional[str] = None) -> List:
         """
         Специальное извлечение для обновлений информации
         """
         import re
         update_facts = []
+        if text_lower is None:
+            text_lower = text.lower()
         
         # Паттерны для обнаружения изменений
         update_patterns = [
@@ -475,11 +489,11 @@ class ExtractionModule(IFactExtractor):
             if match:
                 # Определяем значение для факта
                 if fact_type == self.FactType.FAMILY_STATUS:
-                    if 'женился' in text.lower() or 'женат' in text.lower():
+                    if 'женился' in text_lower or 'женат' in text_lower:
                         value = 'женат'
-                    elif 'замужем' in text.lower() or 'вышла замуж' in text.lower():
+                    elif 'замужем' in text_lower or 'вышла замуж' in text_lower:
                         value = 'замужем'
-                    elif 'развел' in text.lower():
+                    elif 'развел' in text_lower:
                         value = 'разведен'
                     else:
                         continue
@@ -611,7 +625,7 @@ class ExtractionModule(IFactExtractor):
             return relation.value
         return str(relation)
     
-    def _is_copypaste(self, text: str) -> bool:
+    def _is_copypaste(self, text: str, text_lower: Optional[str] = None) -> bool:
         """
         Определяет является ли текст копипастом
         """
@@ -619,22 +633,27 @@ class ExtractionModule(IFactExtractor):
         if len(text) > 5000:
             return True
         
-        # Проверяем личные маркеры
-        personal_markers = ['я ', 'меня', 'мой', 'моя', 'мое', 'мне', 'у меня']
-        personal_count = sum(text.lower().count(marker) for marker in personal_markers)
+        # Текст приводится к нижнему регистру один раз для всех проверок маркеров
+        if text_lower is None:
+            text_lower = text.lower()
         
-        # Если мало личных маркеров - вероятно копипаст
-        if len(text) > 1000 and personal_count < 3:
-            return True
+        # Проверяем личные маркеры (имеет смысл только для длинных текстов)
+        if len(text) > 1000:
+            personal_markers = ['я ', 'меня', 'мой', 'моя', 'мое', 'мне', 'у меня']
+            personal_count = sum(text_lower.count(marker) for marker in personal_markers)
+            
+            # Если мало личных маркеров - вероятно копипаст
+            if personal_count < 3:
+                return True
         
         # Проверяем специфические признаки
         copypaste_indicators = [
             text.count('\n\n') > 10,
-            'википедия' in text.lower(),
-            'copyright' in text.lower(),
+            'википедия' in text_lower,
+            'copyright' in text_lower,
             '©' in text,
             text.count('http') > 3,
-            'источник:' in text.lower(),
+            'источник:' in text_lower,
         ]
         
         return sum(copypaste_indicators) >= 2
@@ -669,9 +688,12 @@ class ExtractionModule(IFactExtractor):
     def _create_cache_key(self, *args) -> str:
         """
         Создает ключ для кэша
+        64-битный xxh3 если доступен (на порядок быстрее md5), иначе blake2b-64
         """
         key_str = '_'.join(str(arg)[:50] for arg in args if arg)
-        return hashlib.md5(key_str.encode()).hexdigest()
+        if XXHASH_AVAILABLE:
+            return f"{xxhash.xxh3_64_intdigest(key_str.encode()):016x}"
+        return hashlib.blake2b(key_str.encode(), digest_size=8).hexdigest()
     
     # === МЕТОДЫ СОВМЕСТИМОСТИ С ПРЕДЫДУЩЕЙ ВЕРСИЕЙ ===
     
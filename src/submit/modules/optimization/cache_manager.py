@@ -26,16 +26,16 @@ class CacheEntry:
     size_bytes: int = 0
     ttl: Optional[int] = None  # Time to live в секундах
     
-    def is_expired(self) -> bool:
-        """Проверяет, истек ли срок записи"""
+    def is_expired(self, now: Optional[datetime] = None) -> bool:
+        """Проверяет, истек ли срок записи (now - уже взятое текущее время)"""
         if self.ttl is None:
             return False
-        age = (datetime.now() - self.created_at).total_seconds()
+        age = ((now or datetime.now()) - self.created_at).total_seconds()
         return age > self.ttl
     
-    def touch(self):
+    def touch(self, now: Optional[datetime] = None):
         """Обновляет время последнего доступа"""
-        self.last_accessed = datetime.now()
+        self.last_accessed = now or datetime.now()
         self.access_count += 1
 
 
@@ -114,15 +114,17 @@ class CacheManager:
                 # Общий кэш
                 if key in self.cache:
                     entry = self.cache[key]
+                    # Одно обращение к часам на попадание - и для TTL, и для доступа
+                    now = datetime.now()
                     
                     # Проверяем TTL
-                    if entry.is_expired():
+                    if entry.is_expired(now):
                         self._evict_entry(key)
                         self.stats['misses'] += 1
                         return None
                     
                     # Обновляем статистику доступа
-                    entry.touch()
+                    entry.touch(now)
                     
                     # Для LRU перемещаем в конец
                     if self.eviction_strategy == "lru":
@@ -7,12 +7,13 @@ import zlib
 import hashlib
 import logging
 import threading
+from itertools import islice
 import psutil
 import numpy as np
 from typing import Dict, Any, Optional, List, Callable, Tuple
 from datetime import datetime, timedelta
 from pathlib import Path
-from collections import OrderedDict, defaultdict
+from collections import OrderedDict, defaultdict, deque
 from dataclasses import dataclass, field
 import queue
 
@@ -57,9 +58,10 @@ class PerformanceMonitor:
         self.lock = threading.RLock()
         self.process = psutil.Process()
         
-        # История метрик для анализа трендов
-        self.history = []
+        # История метрик для анализа трендов: deque с maxlen вытесняет старые
+        # записи за O(1) вместо копирования хвоста списка при переполнении
         self.max_history_size = 1000
+        self.history = deque(maxlen=self.max_history_size)
         
         # Запускаем мониторинг ресурсов
         self._start_resource_monitoring()
@@ -112,8 +114,6 @@ class PerformanceMonitor:
     def _add_to_history(self, record: Dict):
         """Добавляет запись в историю"""
         self.history.append(record)
-        if len(self.history) > self.max_history_size:
-            self.history = self.history[-self.max_history_size:]
     
     def get_report(self) -> Dict[str, Any]:
         """Возвращает отчет о производительности"""
@@ -141,12 +141,13 @@ class PerformanceMonitor:
     
     def get_trends(self) -> Dict[str, Any]:
         """Анализирует тренды производительности"""
-        if not self.history:
+        # Анализируем последние 100 записей (копия под блокировкой - deque нельзя
+        # обходить, пока в него пишет другой поток)
+        with self.lock:
+            recent = list(islice(self.history, max(0, len(self.history) - 100), None))
+        if not recent:
             return {}
         
-        # Анализируем последние 100 записей
-        recent = self.history[-100:]
-        
         # Вычисляем тренды
         processing_times = [r['processing_time'] for r in recent]
         batch_sizes = [r['batch_size'] for r in recent]
@@ -212,7 +213,7 @@ class OptimizationModule(IOptimizer):
         self.config = config
         
         # Многоуровневое кэширование
-        self.l1_cache = {}  # In-memory быстрый кэш
+        self.l1_cache: OrderedDict[str, Any] = OrderedDict()  # In-memory LRU кэш
         self.l1_max_size = config.get('l1_cache_size', 100)
         
         # L2 - основной кэш
@@ -431,10 +432,9 @@ class OptimizationModule(IOptimizer):
                         # Очищаем L1 если слишком большой
                         if len(self.l1_cache) > self.l1_max_size * 2:
                             # Удаляем половину старых записей
-                            keys = list(self.l1_cache.keys())[:self.l1_max_size]
-                            for key in keys:
-                                del self.l1_cache[key]
-                            logger.info(f"L1 cache cleaned: {len(keys)} entries removed")
+                            for _ in range(self.l1_max_size):
+                                self.l1_cache.popitem(last=False)
+                            logger.info(f"L1 cache cleaned: {self.l1_max_size} entries removed")
                     
                     # Очищаем просроченные в L2
                     self.l2_cache.clear('expired')
@@ -493,18 +493,19 @@ class OptimizationModule(IOptimizer):
     
     def _promote_to_l1(self, key: str, value: Any):
         """Поднимает значение в L1 кэш"""
-        if len(self.l1_cache) >= self.l1_max_size:
-            # Удаляем самый старый элемент (простой FIFO для L1)
-            oldest_key = next(iter(self.l1_cache))
-            del self.l1_cache[oldest_key]
+        if key in self.l1_cache:
+            # Перезапись не вытесняет соседей
+            self.l1_cache.move_to_end(key)
+        elif len(self.l1_cache) >= self.l1_max_size:
+            # Удаляем давно не использованный элемент - O(1)
+            self.l1_cache.popitem(last=False)
         
         self.l1_cache[key] = value
     
     def _update_l1_lru(self, key: str):
         """Обновляет LRU для L1 кэша"""
-        # Перемещаем в конец (самый свежий)
-        value = self.l1_cache.pop(key)
-        self.l1_cache[key] = value
+        # Перемещаем в конец (самый свежий) без pop/вставки
+        self.l1_cache.move_to_end(key)
     
     def _get_from_disk_cache(self, key: str) -> Optional[Any]:
         """Получает значение из дискового кэша"""
@@ -541,14 +542,14 @@ class OptimizationModule(IOptimizer):
         
         cache_dir = Path(self.l3_cache_path)
         max_age_days = self.config.get('l3_cache_max_age_days', 7)
-        cutoff_time = datetime.now() - timedelta(days=max_age_days)
+        # Порог в секундах epoch - сравниваем с st_mtime без datetime на каждый файл
+        cutoff_time = (datetime.now() - timedelta(days=max_age_days)).timestamp()
         
         removed_count = 0
         for filepath in cache_dir.glob("*.pkl"):
             try:
                 # Проверяем возраст файла
-                mtime = datetime.fromtimestamp(filepath.stat().st_mtime)
-                if mtime < cutoff_time:
+                if filepath.stat().st_mtime < cutoff_time:
                     filepath.unlink()
                     removed_count += 1
             except Exception as e:
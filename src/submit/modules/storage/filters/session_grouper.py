@@ -20,8 +20,10 @@ class SessionGrouper:
         # Реестр зарегистрированных сессий
         self.registered_sessions = defaultdict(set)
         
-        # Группированные сообщения по диалогам и сессиям
-        self.grouped_sessions = defaultdict(lambda: defaultdict(list))
+        # Группированные сообщения по диалогам и сессиям.
+        # Обычный dict: диалог всегда записывается целиком, фабрика-лямбда
+        # не нужна (и мешала pickle)
+        self.grouped_sessions: Dict[str, Dict[str, List[Message]]] = {}
         
         # Детальная информация о сессиях
         self.session_info = defaultdict(dict)
@@ -157,7 +159,7 @@ class SessionGrouper:
         """Очищает все сессии диалога"""
         self.session_counters[dialogue_id] = 0
         self.registered_sessions[dialogue_id].clear()
-        self.grouped_sessions[dialogue_id] = defaultdict(list)
+        self.grouped_sessions[dialogue_id] = {}
         self.session_info[dialogue_id].clear()
     
     # === Методы статистики ===
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Тесты поиска EmbeddingsModule и VectorStore: ранжирование по ключевым словам,
+пакетные API против поштучных вызовов
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from unittest.mock import Mock
+
+import numpy as np
+
+from models import Message
+from submit.modules.embeddings.module import EmbeddingsModule
+from submit.modules.embeddings.vector_store import VectorStore
+from test_vector_search import _make_tiny_model
+
+
+def _baseline_scores(results, keywords):
+    """Исходное ранжирование: буст 1.2 за каждое ключевое слово в тексте"""
+    scores = []
+    for result in results:
+        score = result['score']
+        text_lower = result['text'].lower()
+        for kw in keywords:
+            if kw.lower() in text_lower:
+                score *= 1.2
+        scores.append(score)
+    return scores
+
+
+def test_rank_results_matches_baseline():
+    """Переранжирование совпадает с исходным, включая вложенные ключевые слова"""
+    embeddings = EmbeddingsModule({'device': 'cpu'})
+    embeddings.vector_store = Mock()
+    embeddings.vector_store.get_metadata.return_value = None
+    embeddings.vector_store.texts = {}
+
+    texts = [
+        "Я работаю дома",
+        "Работа в офисе",
+        "Живу в большом доме",
+        "Про погоду",
+        "Дом, работа, работаю без выходных",
+    ]
+    cases = [
+        ["работа", "работаю", "дом"],
+        ["работа", "дом"],
+        ["Работа", "ДОМ", "офис", "погоду"],
+        ["дом", "дом", "работа"],
+        [],
+    ]
+
+    for keywords in cases:
+        results = [
+            {'index': i, 'text': text, 'score': 1.0 - i * 0.01}
+            for i, text in enumerate(texts)
+        ]
+        expected = _baseline_scores(results, keywords)
+
+        ranked = embeddings._rank_results("dlg", results, keywords)
+        got = {r['index']: r['final_score'] for r in ranked}
+
+        for i, score in enumerate(expected):
+            if i in got:
+                assert abs(got[i] - score) < 1e-9, (keywords, texts[i], got[i], score)
+
+    # "я работаю дома": все три слова найдены
+    results = [{'index': 0, 'text': texts[0], 'score': 1.0}]
+    ranked = embeddings._rank_results("dlg", results, ["работа", "работаю", "дом"])
+    assert abs(ranked[0]['final_score'] - 1.2 ** 3) < 1e-9
+
+
+def _same_results(batch, single):
+    """Одинаковые строки в том же порядке, score с точностью до float32"""
+    assert [r['index'] for r in batch] == [r['index'] for r in single]
+    assert [r['text'] for r in batch] == [r['text'] for r in single]
+    for rb, rs in zip(batch, single):
+        assert abs(rb['score'] - rs['score']) < 1e-5
+
+
+def test_hybrid_search_batch_matches_single(tmp_path):
+    """hybrid_search_batch даёт те же результаты, что hybrid_search по одному"""
+    embeddings = EmbeddingsModule({
+        'model_name': _make_tiny_model(tmp_path),
+        'device': 'cpu',
+        'use_faiss': False
+    })
+    sessions = {
+        "s1": [
+            Message(role="user", content="Привет, я работаю дома уже год", session_id="s1"),
+            Message(role="user", content="Я живу в Москве с семьей", session_id="s1"),
+        ],
+        "s2": [
+            Message(role="user", content="Погода сегодня солнечно и тепло", session_id="s2"),
+            Message(role="user", content="Как дела у тебя сегодня дома", session_id="s2"),
+        ],
+    }
+    result = embeddings.index_dialogue("dlg", sessions)
+    assert result.success, result.error
+
+    queries = ["где я работаю", "погода сегодня", "живу в москве"]
+    batch = embeddings.hybrid_search_batch(queries, "dlg")
+    assert batch.success, batch.error
+    assert len(batch.data) == len(queries)
+    assert all(batch.data)
+
+    for query, batch_results in zip(queries, batch.data):
+        single = embeddings.hybrid_search(query, "dlg")
+        assert single.success, single.error
+        _same_results(batch_results, single.data)
+        for rb, rs in zip(batch_results, single.data):
+            assert abs(rb['final_score'] - rs['final_score']) < 1e-5
+
+    # Загрузка и очистка диалога пересобирают/сбрасывают кэш нижнего регистра
+    path = str(tmp_path / "dlg_index")
+    assert embeddings.vector_store.save("dlg", path)
+    embeddings.clear_dialogue("dlg")
+    assert "dlg" not in embeddings._text_lower
+    assert embeddings.load_dialogue("dlg", path)
+    assert embeddings._text_lower["dlg"][1] == [
+        text.lower() for text in embeddings.vector_store.texts["dlg"]
+    ]
+
+    # Прямые clear_dialogue/load/add_batch хранилища в обход модуля
+    expected = embeddings.hybrid_search_batch(queries, "dlg").data
+    store = embeddings.vector_store
+    store.clear_dialogue("dlg")
+    assert embeddings.hybrid_search(queries[0], "dlg").data == []
+    assert "dlg" not in embeddings._text_lower
+
+    assert store.load("dlg", path)
+    for query, exp in zip(queries, expected):
+        got = embeddings.hybrid_search(query, "dlg").data
+        _same_results(got, exp)
+        for rg, re_ in zip(got, exp):
+            assert abs(rg['final_score'] - re_['final_score']) < 1e-5
+
+    vector = embeddings.engine.encode_batch(["Я живу в Москве с семьей"])
+    store.add_batch("dlg", vector, ["ЖИВУ В МОСКВЕ"], normalized=True)
+    assert embeddings._get_text_lower("dlg") == [
+        text.lower() for text in store.texts["dlg"]
+    ]
+    assert embeddings._get_text_lower("dlg")[-1] == "живу в москве"
+
+
+def test_metadata_priority_is_exact():
+    """Приоритет в метаданных не округляется до float32"""
+    from submit.modules.embeddings.vector_models import MetadataSoA
+
+    priorities = [7 / 15, 0.1, 1 / 3, 0.0, 1.0]
+    metadata = MetadataSoA.from_dicts([
+        {'session_id': f"s{i}", 'msg_idx': i, 'chunk_idx': 0, 'priority': p}
+        for i, p in enumerate(priorities)
+    ])
+    metadata.extend(MetadataSoA.from_dicts([{'session_id': "s9", 'priority': 7 / 15}]))
+
+    assert [metadata.row(i)['priority'] for i in range(len(metadata))] == priorities + [7 / 15]
+    assert metadata.row(0)['priority'] == 0.4666666666666667
+
+
+def _filled_store(seed=0):
+    rng = np.random.default_rng(seed)
+    store = VectorStore(metric="cosine")
+    for d in range(3):
+        for s in range(2):
+            n = 20 + 5 * d
+            store.add_vectors(
+                f"dlg_{d}", f"session_{s}",
+                rng.standard_normal((n, 16)).astype(np.float32),
+                [f"text {d}-{s}-{i}" for i in range(n)]
+            )
+    return store, rng
+
+
+def test_vector_store_search_batch_matches_search():
+    """search_batch построчно совпадает с search"""
+    store, rng = _filled_store()
+    queries = rng.standard_normal((7, 16)).astype(np.float32)
+
+    for threshold in (None, 0.1):
+        batch = store.search_batch("dlg_1", queries, top_k=5, threshold=threshold)
+        assert len(batch) == len(queries)
+        for query, batch_results in zip(queries, batch):
+            single = store.search("dlg_1", query, top_k=5, threshold=threshold)
+            _same_results(batch_results, single)
+            assert ([r['session_id'] for r in batch_results]
+                    == [r['session_id'] for r in single])
+
+
+def test_vector_store_search_many_matches_search():
+    """search_many по диалогам совпадает с search для каждого диалога"""
+    store, rng = _filled_store(seed=1)
+    query = rng.standard_normal(16).astype(np.float32)
+    dialogue_ids = ["dlg_0", "dlg_1", "dlg_2", "missing"]
+
+    try:
+        many = store.search_many(dialogue_ids, query, top_k=4)
+    finally:
+        store.shutdown()
+
+    assert list(many) == dialogue_ids
+    for dialogue_id in dialogue_ids:
+        _same_results(many[dialogue_id], store.search(dialogue_id, query, top_k=4))
+    assert many["missing"] == []
+    assert store._executor is None
+
+    # Собственный пул ограничен и освобождается после очистки всех диалогов
+    store.search_many(dialogue_ids, query, top_k=4)
+    assert store._executor._max_workers <= VectorStore.MAX_SEARCH_WORKERS
+    for dialogue_id in dialogue_ids[:-1]:
+        store.clear_dialogue(dialogue_id)
+    assert store._executor is None
+
+
+def test_vector_store_search_many_with_executor():
+    """search_many на пуле вызывающего кода не создаёт собственный"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    store, rng = _filled_store(seed=5)
+    query = rng.standard_normal(16).astype(np.float32)
+    dialogue_ids = ["dlg_0", "dlg_1", "dlg_2"]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        many = store.search_many(dialogue_ids, query, top_k=4, executor=executor)
+    assert store._executor is None
+    for dialogue_id in dialogue_ids:
+        _same_results(many[dialogue_id], store.search(dialogue_id, query, top_k=4))
+
+
+def test_vector_store_query_cache_invalidation():
+    """Кэш топ-k сбрасывается при добавлении векторов и очистке диалога"""
+    store, rng = _filled_store(seed=2)
+    store.query_cache_size = 8
+    query = rng.standard_normal(16).astype(np.float32)
+
+    first = store.search("dlg_0", query, top_k=3)
+    again = store.search("dlg_0", query, top_k=3)
+    assert store.stats['score_cache_hits'] == 1
+    _same_results(again, first)
+
+    # Другой k - другая запись кэша
+    assert len(store.search("dlg_0", query, top_k=5)) == 5
+    assert store.stats['score_cache_hits'] == 1
+
+    # Вектор, совпадающий с запросом, должен стать первым результатом
+    store.add_vectors("dlg_0", "session_new", query.reshape(1, -1), ["точное совпадение"])
+    after_add = store.search("dlg_0", query, top_k=3)
+    assert after_add[0]['text'] == "точное совпадение"
+    assert store.stats['score_cache_hits'] == 1
+
+    store.clear_dialogue("dlg_0")
+    assert store.search("dlg_0", query, top_k=3) == []
+
+
+def test_vector_store_save_load_roundtrip(tmp_path):
+    """save -> load -> search -> add: с mmap и без, результаты как до сохранения"""
+    store, rng = _filled_store(seed=3)
+    queries = rng.standard_normal((3, 16)).astype(np.float32)
+    expected = store.search_batch("dlg_2", queries, top_k=5)
+    path = str(tmp_path / "dlg_2.json")
+    assert store.save("dlg_2", path)
+
+    for mmap in (False, True):
+        loaded = VectorStore(metric="cosine")
+        assert loaded.load("dlg_2", path, mmap=mmap)
+        assert isinstance(loaded.dialogue_vectors["dlg_2"], np.memmap) == mmap
+
+        for got, exp in zip(loaded.search_batch("dlg_2", queries, top_k=5), expected):
+            _same_results(got, exp)
+            assert [r['session_id'] for r in got] == [r['session_id'] for r in exp]
+
+        # Добавление после загрузки переносит матрицу в буфер с ростом
+        n = len(loaded.dialogue_texts["dlg_2"])
+        loaded.add_vectors("dlg_2", "session_new", queries[:1], ["новый текст"])
+        assert not isinstance(loaded.dialogue_vectors["dlg_2"], np.memmap)
+        top = loaded.search("dlg_2", queries[0], top_k=1)[0]
+        assert top['text'] == "новый текст"
+        assert top['index'] == n
+        assert top['session_id'] == "session_new"
+
+
+def test_improved_vector_store_save_load_roundtrip(tmp_path):
+    """ImprovedVectorStore: save -> load -> search -> add для FAISS и numpy, fp32/fp16"""
+    from submit.modules.embeddings.improved_vector_store import ImprovedVectorStore
+    from submit.modules.embeddings.vector_models import MetadataSoA
+
+    rng = np.random.default_rng(4)
+    n, dim = 40, 312
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    texts = [f"чанк {i}" for i in range(n)]
+    metadata = MetadataSoA.from_dicts([
+        {'session_id': f"s{i % 3}", 'msg_idx': i, 'chunk_idx': i % 2, 'priority': i / n}
+        for i in range(n)
+    ])
+    queries = rng.standard_normal((4, dim)).astype(np.float32)
+
+    for use_faiss in (False, True):
+        for precision in ("fp32", "fp16"):
+            store = ImprovedVectorStore(use_faiss=use_faiss, precision=precision)
+            store.add_batch("dlg", vectors, texts, metadata)
+            expected = store.search_batch("dlg", queries, top_k=5)
+
+            path = str(tmp_path / f"dlg_{use_faiss}_{precision}")
+            assert store.save("dlg", path)
+
+            for mmap in (False, True):
+                loaded = ImprovedVectorStore(use_faiss=use_faiss, precision=precision)
+                assert loaded.load("dlg", path, mmap=mmap)
+                assert loaded.texts["dlg"] == texts
+
+                for got, exp in zip(loaded.search_batch("dlg", queries, top_k=5), expected):
+                    _same_results(got, exp)
+                    assert [r['metadata'] for r in got] == [r['metadata'] for r in exp]
+
+                loaded.add_batch("dlg", queries[:1], ["новый чанк"])
+                top = loaded.search("dlg", queries[0], top_k=1)[0]
+                assert top['text'] == "новый чанк"
+                assert top['index'] == n
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    test_rank_results_matches_baseline()
+    test_metadata_priority_is_exact()
+    with tempfile.TemporaryDirectory() as d:
+        test_hybrid_search_batch_matches_single(Path(d))
+    test_vector_store_search_batch_matches_search()
+    test_vector_store_search_many_matches_search()
+    test_vector_store_search_many_with_executor()
+    test_vector_store_query_cache_invalidation()
+    with tempfile.TemporaryDirectory() as d:
+        test_vector_store_save_load_roundtrip(Path(d))
+        test_improved_vector_store_save_load_roundtrip(Path(d))
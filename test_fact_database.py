@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Тест FactIndex/FactDatabase: индексация, удаление и повторный поиск
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from submit.modules.extraction.fact_database import FactDatabase
+from submit.modules.extraction.fact_models import Fact, FactConfidence, FactType
+
+
+def _hobby(subject, obj, score=0.8, raw_text=None):
+    return Fact(
+        type=FactType.HOBBY_ACTIVITY, subject=subject, relation="likes", object=obj,
+        confidence=FactConfidence(score=score, source="extracted"),
+        session_id="s1", dialogue_id="dlg", raw_text=raw_text
+    )
+
+
+def test_fact_index_remove_and_requery():
+    """После удаления факт пропадает из всех постингов, порядок выдачи стабилен"""
+    db = FactDatabase()
+    facts = [
+        _hobby("пользователь", "футбол по выходным"),
+        _hobby("брат", "шахматы"),
+        _hobby("сестра", "футбол во дворе", raw_text="Сестра играет в футбол"),
+        _hobby("друг", "плавание", score=0.95),
+        _hobby("отец", "рыбалка"),
+        _hobby("мать", "футбол по телевизору"),
+    ]
+    db.add_facts("dlg", facts)
+    ids = [f.id for f in facts]
+
+    # При равной уверенности - порядок добавления
+    expected = [ids[3], ids[0], ids[1], ids[2], ids[4], ids[5]]
+    assert [f.id for f in db.query_facts("dlg", fact_type=FactType.HOBBY_ACTIVITY)] == expected
+    assert [f.id for f in db.query_facts("dlg", query="футбол")] == [ids[0], ids[2], ids[5]]
+
+    removed = facts[2]
+    db.delete_fact(removed.id)
+
+    index = db.index
+    for postings in (index.by_type, index.by_subject, index.by_relation,
+                     index.by_dialogue, index.by_session, index.by_object,
+                     index.text_index):
+        assert all(postings.values()), "пустые постинги должны удаляться"
+        assert not any(removed.id in fact_ids for fact_ids in postings.values())
+    assert "сестра" not in index.by_subject
+    assert "дворе" not in index.text_index and "играет" not in index.text_index
+
+    expected.remove(removed.id)
+    assert [f.id for f in db.query_facts("dlg", fact_type=FactType.HOBBY_ACTIVITY)] == expected
+    assert [f.id for f in db.query_facts("dlg", query="футбол")] == [ids[0], ids[5]]
+    assert db.find_fact_by_type_and_subject("dlg", FactType.HOBBY_ACTIVITY, "сестра") is None
+
+    # Повторное добавление - в конец порядка диалога
+    db.add_facts("dlg", [removed])
+    assert [f.id for f in db.query_facts("dlg", query="футбол")] == [ids[0], ids[5], ids[2]]
+    assert index.search_by_text("играет") == {removed.id}
+
+
+if __name__ == "__main__":
+    test_fact_index_remove_and_requery()
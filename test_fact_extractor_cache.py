@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Тест кэша RuleBasedFactExtractor - попадания/промахи и статистика
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from unittest.mock import patch
+
+from submit.modules.extraction.fact_extractor import RuleBasedFactExtractor
+
+
+def _fact_view(facts):
+    return [(f.type, f.object, f.confidence.score, f.session_id, f.dialogue_id) for f in facts]
+
+
+def test_rule_extractor_cache():
+    """Кэш RuleBasedFactExtractor: попадания не гоняют паттерны, факты и статистика как без кэша"""
+    texts = [
+        "Меня зовут Иван, мне 25 лет, я работаю программистом в Москве.",
+        "Я живу в Москве, мне 30 лет",
+        "Меня зовут Иван, мне 25 лет, я работаю программистом в Москве.",
+        "Привет",
+        "Я живу в Москве, мне 30 лет",
+    ]
+    
+    cached = RuleBasedFactExtractor(min_confidence=0.5)
+    plain = RuleBasedFactExtractor(min_confidence=0.5, cache_size=0)
+    
+    with patch.object(cached, '_extract_facts', wraps=cached._extract_facts) as spy:
+        for i, text in enumerate(texts):
+            got = cached.extract_facts_from_text(text, f"s{i}", "dlg")
+            expected = plain.extract_facts_from_text(text, f"s{i}", "dlg")
+            assert _fact_view(got) == _fact_view(expected)
+        # Повторы взяты из кэша
+        assert spy.call_count == 3
+    
+    assert cached.get_stats() == plain.get_stats()
+    
+    # Возвращённые факты независимы от шаблонов кэша
+    first = cached.extract_facts_from_text(texts[0], "s9", "dlg")
+    first[0].confidence.score = 0.0
+    again = cached.extract_facts_from_text(texts[0], "s9", "dlg")
+    assert again[0].confidence.score != 0.0
+    
+    # Смена min_confidence - промах: факты при старом пороге не возвращаются
+    with patch.object(cached, '_extract_facts', wraps=cached._extract_facts) as spy:
+        cached.min_confidence = 0.9
+        cached.extract_facts_from_text(texts[0], "s1", "dlg")
+        assert spy.call_count == 1
+        cached.extract_facts_from_text(texts[0], "s1", "dlg")
+        assert spy.call_count == 1
+    
+    # Пересборка критических паттернов сбрасывает кэш
+    cached._compile_critical_patterns()
+    assert not cached._facts_cache
+
+
+if __name__ == "__main__":
+    test_rule_extractor_cache()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Тесты ImprovedEmbeddingEngine на маленькой случайной BERT-модели (без сети)
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from unittest.mock import patch
+
+import numpy as np
+import torch
+
+from submit.modules.embeddings.vector_search import EmbeddingConfig, ImprovedEmbeddingEngine
+
+
+def _make_tiny_model(path):
+    """Сохраняет маленькую BERT-модель с токенизатором в path"""
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    words = "привет как дела я работаю дома живу в москве погода сегодня солнечно".split()
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words
+    vocab_file = os.path.join(path, "vocab.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(vocab))
+    BertTokenizerFast(vocab_file=vocab_file, do_lower_case=True).save_pretrained(path)
+
+    torch.manual_seed(0)
+    config = BertConfig(
+        vocab_size=len(vocab), hidden_size=32, num_hidden_layers=1,
+        num_attention_heads=2, intermediate_size=64, max_position_embeddings=128
+    )
+    BertModel(config).save_pretrained(path)
+    return str(path)
+
+
+def test_quantize_model_on_cpu(tmp_path):
+    """quantize_model на CPU грузит fp32 и действительно квантизует Linear"""
+    model_dir = _make_tiny_model(tmp_path)
+    config = EmbeddingConfig(
+        model_name=model_dir, device="cpu", max_length=64, quantize_model=True
+    )
+    assert not config.use_amp, "quantize_model на CPU должен отключать use_amp"
+
+    with patch.object(ImprovedEmbeddingEngine, '_cpu_has_int8_dot',
+                      staticmethod(lambda: True)):
+        engine = ImprovedEmbeddingEngine(config)
+
+    quantized = [m for m in engine.model.modules()
+                 if isinstance(m, torch.ao.nn.quantized.dynamic.Linear)]
+    assert quantized, "Linear-слои не были квантизованы"
+    assert not any(type(m) is torch.nn.Linear for m in engine.model.modules())
+
+    vectors = engine.encode(["привет как дела", "я работаю дома"])
+    assert vectors.shape == (2, 32)
+
+
+def test_encode_empty_list(tmp_path):
+    """Пустой список - массив (0, dim) float32, с кэшем и без"""
+    model_dir = _make_tiny_model(tmp_path)
+    for use_cache in (True, False):
+        engine = ImprovedEmbeddingEngine(EmbeddingConfig(
+            model_name=model_dir, device="cpu", max_length=64, use_cache=use_cache
+        ))
+        vectors = engine.encode([])
+        assert isinstance(vectors, np.ndarray)
+        assert vectors.shape == (0, 32)
+        assert vectors.dtype == np.float32
+
+
+def test_encode_with_partial_cache_hits(tmp_path):
+    """Частичные попадания в кэш и повторы внутри запроса дают те же векторы"""
+    model_dir = _make_tiny_model(tmp_path)
+    engine = ImprovedEmbeddingEngine(EmbeddingConfig(
+        model_name=model_dir, device="cpu", max_length=64
+    ))
+    texts = ["привет как дела", "я работаю дома", "погода сегодня солнечно", "живу в москве"]
+    reference = engine.encode(texts)
+
+    engine.clear_cache()
+    engine.encode(texts[:2])
+    mixed = engine.encode([texts[2], texts[0], texts[2], texts[3], texts[1]])
+
+    expected = reference[[2, 0, 2, 3, 1]]
+    # Кэш хранит fp16
+    assert np.allclose(mixed, expected, atol=2e-3)
+
+
+def test_encode_to_memmap_matches_encode(tmp_path):
+    """encode_to_memmap пишет в файл те же векторы, что и encode (с точностью fp16)"""
+    model_dir = _make_tiny_model(tmp_path)
+    engine = ImprovedEmbeddingEngine(EmbeddingConfig(
+        model_name=model_dir, device="cpu", max_length=64, batch_size=2,
+        prefetch_batches=2, use_cache=False
+    ))
+    # Несколько блоков по batch_size * prefetch_batches, разные длины
+    texts = ["привет", "я работаю дома", "погода сегодня солнечно как дела",
+             "живу в москве", "дела", "привет как дела я живу в москве", "сегодня"]
+
+    mm = engine.encode_to_memmap(texts, tmp_path / "vectors.f16")
+    assert mm.shape == (len(texts), 32)
+    assert mm.dtype == np.float16
+    assert np.allclose(np.asarray(mm, dtype=np.float32), engine.encode(texts), atol=2e-3)
+
+    assert engine.encode_to_memmap([], tmp_path / "empty.f16") is None
+
+
+def test_onnx_quantization_isa():
+    """Конфиг ONNX-квантизации выбирается по флагам CPU, по умолчанию avx2"""
+    cases = [
+        ({'avx2', 'avx512f', 'avx512_vnni'}, 'avx512_vnni'),
+        ({'avx2', 'avx512f', 'amx_int8'}, 'avx512_vnni'),
+        ({'avx2', 'avx512f'}, 'avx512'),
+        ({'avx2', 'avx_vnni'}, 'avx2'),
+        (set(), 'avx2'),
+    ]
+    for flags, expected in cases:
+        with patch.object(ImprovedEmbeddingEngine, '_cpu_flags', staticmethod(lambda: flags)):
+            assert ImprovedEmbeddingEngine._onnx_quantization_isa() == expected
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+    test_onnx_quantization_isa()
+    with tempfile.TemporaryDirectory() as d:
+        test_quantize_model_on_cpu(d)
+        test_encode_empty_list(d)
+        test_encode_with_partial_cache_hits(d)
+        test_encode_to_memmap_matches_encode(Path(d))